@@ -1,4 +1,15 @@
 """cosmofy: Cosmopolitan Python Bundler"""
 
+# std
+from typing import Any
+from typing import Dict
+import sys
+
 __version__ = "0.1.0"
 __pubdate__ = "2024-09-18T18:55:19Z"
+
+CHUNK_SIZE = 1 << 20
+"""Bytes to read at a time when hashing or downloading a file (1 MiB)."""
+
+SLOTS: Dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
+"""Use `__slots__` for dataclasses when supported (python >= 3.10)."""
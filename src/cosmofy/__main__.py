@@ -11,47 +11,49 @@ import sys
 from . import __pubdate__
 from . import __version__
 from .args import Args
-from .args import USAGE
-from .bundler import Bundler
+from .args import short_usage
+from .args import usage
 
 log_normal = "%(levelname)s: %(message)s"
 log_debug = "%(name)s.%(funcName)s: %(levelname)s: %(message)s"
 log_verbose = " %(filename)s:%(lineno)s %(funcName)s(): %(levelname)s: %(message)s"
-logging.basicConfig(level=logging.INFO, format=log_normal)
 
 log = logging.getLogger(__name__)
 
 
 def main(argv: Optional[List[str]] = None) -> int:
     """Main entry point."""
-    short_usage = "\n" + USAGE[USAGE.find("USAGE") + 5 : USAGE.find("GENERAL")].strip()
-
     try:
         args = Args.parse((argv or sys.argv)[1:])
     except ValueError as e:
+        logging.basicConfig(level=logging.INFO, format=log_normal)
         log.error(e)
-        print(short_usage)
+        print(short_usage())
         return 1
 
     if args.debug:
+        logging.basicConfig(level=logging.DEBUG, format=log_debug)
+        # NOTE: `basicConfig` does nothing if the root logger has handlers.
         root_logger = logging.getLogger()
         root_logger.setLevel(logging.DEBUG)
         formatter = logging.Formatter(log_debug)
         for handler in root_logger.handlers:
             handler.setFormatter(formatter)
         log.debug(args)
+    else:
+        logging.basicConfig(level=logging.INFO, format=log_normal)
 
     if args.version:
         print(f"{__version__} ({__pubdate__})", flush=True)
         return 0
 
     if args.help:
-        print(USAGE)
+        print(usage())
         return 0
 
     if not args.add:
         log.error("You must specify at least one path to add.")
-        print(short_usage)
+        print(short_usage())
         return 1
 
     if args.clone and not args.cosmo:
@@ -61,6 +63,8 @@ def main(argv: Optional[List[str]] = None) -> int:
         )
         return 1
 
+    from .bundler import Bundler  # defer loading until we need it
+
     Bundler(args).run()
     return 0
 
@@ -2,12 +2,19 @@
 
 # std
 from __future__ import annotations
+from functools import lru_cache
 from os import environ as ENV
 from pathlib import Path
+from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
 import dataclasses
 import logging
+import pkgutil
+
+# pkg
+from . import SLOTS
 
 log = logging.getLogger(__name__)
 
@@ -17,134 +24,102 @@ DEFAULT_PYTHON_URL = "https://cosmo.zip/pub/cosmos/bin/python"
 COSMOFY_PYTHON_URL = ENV.get("COSMOFY_PYTHON_URL", "")
 """URL to download python from."""
 
-DEFAULT_CACHE_DIR = Path.home() / ".cache" / "cosmofy"
-"""Default cache directory."""
+DEFAULT_CACHE_DIR = Path("~") / ".cache" / "cosmofy"
+"""Default cache directory (`~` is expanded only when used)."""
 
 COSMOFY_CACHE_DIR = ENV.get("COSMOFY_CACHE_DIR", "")
 """Path to cache directory."""
 
+DEFAULT_COMPRESS_LEVEL = 6
+"""Default DEFLATE level for added files (zlib's speed/size trade-off)."""
+
+MAX_JOBS = 61
+"""Most `--jobs` we allow (Windows process pools cannot wait on more)."""
+
+NO_CACHE = frozenset(("0", "false"))
+"""Values of `--cache` that disable caching."""
+
 RECEIPT_URL = ENV.get("RECEIPT_URL", "")
 """Default receipt URL."""
 
 RELEASE_URL = ENV.get("RELEASE_URL", "")
 """Default release URL."""
 
-USAGE = f"""cosmofy: Cosmopolitan Python Bundler
-
-USAGE
-
-  cosmofy
-    [--help] [--version] [--debug] [--dry-run] [--self-update]
-    [--python-url URL] [--cache PATH] [--clone]
-    [--output PATH] [--args STRING]
-    <add>... [--exclude GLOB]... [--remove GLOB]...
-    [--receipt PATH] [--receipt-url URL] [--release-url URL]
-    [--release-version STRING]
-
-GENERAL
-
-  -h, --help        Show this help message and exit.
-  --version         Show program version and exit.
-  --debug           Show debug messages.
-  -n, --dry-run     Do not make any file system changes.
-  --self-update     Update `cosmofy` to the latest version.
-
-CACHE
-
-  --python-url URL
-    URL from which to download Cosmopolitan Python.
-    [default: {DEFAULT_PYTHON_URL}]
-    [env: COSMOFY_PYTHON_URL={COSMOFY_PYTHON_URL}]
-
-  --cache PATH
-    Directory in which to cache Cosmopolitan Python downloads.
-    Use `false` or `0` to disable caching.
-    [default: {str(DEFAULT_CACHE_DIR).replace(str(Path.home()), '~')}]
-    [env: COSMOFY_CACHE_DIR={COSMOFY_CACHE_DIR}]
-
-  --clone
-    Obtain python by cloning `cosmofy` and removing itself instead of
-    downloading it from `--python-url`.
-
-OUTPUT
-
-  -o PATH, --output PATH
-    Path to output file.
-    [default: `<main_module>.com`]
-
-    `<main_module>` is the first module with a `__main__.py` or file with an
-    `if __name__ == "__main__"` line.
-
-FILES
-
-  --args STRING
-    Cosmopolitan Python arguments.
-    [default: `"-m <main_module>"`]
-
-    If NOT using the self-updater, all python options are supported:
-    https://docs.python.org/3/using/cmdline.html
-
-    If using the self-updater only a subset is supported:
-    https://github.com/metaist/cosmofy#supported-python-cli
-
-  --add GLOB, <add>
-    At least one glob-like patterns to add. Folders are recursively added.
-    Files ending in `.py` will be compiled.
-
-  -x GLOB, --exclude GLOB
-    One or more glob-like patterns to exclude from being added.
 
-    Common things to exclude are egg files and python cache:
-    $ cosmofy src -x "**/*.egg-info/*" -x "**/__pycache__/*"
-
-  --rm GLOB, --remove GLOB
-    One or more glob-like patters to remove from the output.
-
-    Common things to remove are `pip`, terminal info, and SSL certs:
-    $ cosmofy src/my_module --rm 'usr/*' --rm 'Lib/site-packages/pip/*'
-
-SELF-UPDATER
-
-  Specifying any of the options below will add `cosmofy.updater`
-  to make the resulting bundle capable of updating itself. You
-  must supply at least `--receipt-url` or `--release-url`.
-
-  In addition to building the bundle, there will be a second output
-  which is a JSON file (called a receipt) that needs to be uploaded
-  together with the bundle.
-
-  If the bundle is run with `--self-update` anywhere in the arguments,
-  `cosmofy.updater` will run. It will compare it's internal build
-  date with the date at `--receipt-url` and will download any updates, if
-  they exist.
-
-  Otherwise, the bundle will run as normal by calling `--args`
-
-  NOTE: The updater will alter `--args` so that it gets called first.
-  It supports most Python Command Line interface options (like `-m`).
-  For a full list see: https://github.com/metaist/cosmofy#supported-python-cli
-
-  --receipt PATH
-    Set the path for the JSON receipt.
-    [default: `<output>.json`]
-
-  --receipt-url URL
-    URL to the published receipt.
-    [default: --release-url + .json]
-    [env: RECEIPT_URL={RECEIPT_URL}]
-
-  --release-url URL
-    URL to the file to download.
-    [default: --receipt-url without .json]
-    [env: RELEASE_URL={RELEASE_URL}]
-
-  --release-version STRING
-    Release version.
-    [default: first version-like string in `$(${{output}} --version)`]
-"""
-
-
-@dataclasses.dataclass
+@lru_cache(maxsize=None)
+def usage() -> str:
+    """Return the full usage text."""
+    data = pkgutil.get_data(__name__, "usage.txt") or b""
+    return data.decode("utf-8").format(
+        default_python_url=DEFAULT_PYTHON_URL,
+        python_url=COSMOFY_PYTHON_URL,
+        default_cache_dir=DEFAULT_CACHE_DIR,
+        default_compress_level=DEFAULT_COMPRESS_LEVEL,
+        cache_dir=COSMOFY_CACHE_DIR,
+        receipt_url=RECEIPT_URL,
+        release_url=RELEASE_URL,
+    )
+
+
+@lru_cache(maxsize=None)
+def short_usage() -> str:
+    """Return the usage summary shown on errors."""
+    text = usage()
+    return "\n" + text[text.find("USAGE") + 5 : text.find("GENERAL")].strip()
+
+
+ALIASES = {
+    "-h": "--help",
+    "-n": "--dry-run",
+    "-o": "--output",
+    "-x": "--exclude",
+    "--rm": "--remove",
+}
+"""Short names for options."""
+
+KIND_BOOL, KIND_STR, KIND_INT, KIND_PATH, KIND_LIST = range(5)
+"""Kinds of option values (ints compare faster than strings)."""
+
+OPTIONS: Dict[str, Tuple[int, str]] = {
+    # bool
+    "--cache-pyc": (KIND_BOOL, "cache_pyc"),
+    "--clone": (KIND_BOOL, "clone"),
+    "--cosmo": (KIND_BOOL, "cosmo"),
+    "--debug": (KIND_BOOL, "debug"),
+    "--dry-run": (KIND_BOOL, "dry_run"),
+    "--help": (KIND_BOOL, "help"),
+    "--version": (KIND_BOOL, "version"),
+    # str
+    "--args": (KIND_STR, "args"),
+    "--python-url": (KIND_STR, "python_url"),
+    "--receipt-url": (KIND_STR, "receipt_url"),
+    "--release-url": (KIND_STR, "release_url"),
+    "--release-version": (KIND_STR, "release_version"),
+    # int
+    "--compress-level": (KIND_INT, "compress_level"),
+    "--jobs": (KIND_INT, "jobs"),
+    # path
+    "--cache": (KIND_PATH, "cache"),
+    "--output": (KIND_PATH, "output"),
+    "--receipt": (KIND_PATH, "receipt"),
+    # list[str]
+    "--add": (KIND_LIST, "add"),
+    "--exclude": (KIND_LIST, "exclude"),
+    "--remove": (KIND_LIST, "remove"),
+}
+"""Map of option (or alias) to its kind and `Args` attribute."""
+
+OPTIONS.update({alias: OPTIONS[name] for alias, name in ALIASES.items()})
+
+
+def default_cache_dir() -> Path:
+    """Return the cache directory to use when `--cache` is not given."""
+    if COSMOFY_CACHE_DIR:
+        return Path(COSMOFY_CACHE_DIR)
+    return DEFAULT_CACHE_DIR.expanduser()
+
+
+@dataclasses.dataclass(**SLOTS)
 class Args:
     help: bool = False
     """Whether to show usage."""
@@ -176,9 +151,12 @@ class Args:
     python_url: str = COSMOFY_PYTHON_URL or DEFAULT_PYTHON_URL
     """URL from which to download Cosmopolitan Python."""
 
-    cache: Optional[Path] = Path(COSMOFY_CACHE_DIR or DEFAULT_CACHE_DIR)
+    cache: Optional[Path] = dataclasses.field(default_factory=default_cache_dir)
     """Directory for caching downloads."""
 
+    cache_pyc: bool = False
+    """Whether to also cache compiled `.py` files (in `cache / "pyc"`)."""
+
     clone: bool = False
     """Whether to clone `cosmofy` to get python."""
 
@@ -187,6 +165,12 @@ class Args:
     output: Optional[Path] = None
     """Path to the output file."""
 
+    compress_level: int = DEFAULT_COMPRESS_LEVEL
+    """DEFLATE level (0-9) for added files."""
+
+    jobs: int = 0
+    """Number of processes compiling `.py` files (`0` = one per CPU)."""
+
     # files
 
     args: str = ""
@@ -225,64 +209,57 @@ class Args:
     @staticmethod
     def parse(argv: List[str]) -> Args:
         args = Args()
-        alias = {
-            "-h": "--help",
-            "-n": "--dry-run",
-            "-o": "--output",
-            "-x": "--exclude",
-            "--rm": "--remove",
-        }
-        while argv:
-            if argv[0].startswith("-"):
-                arg = argv.pop(0)
-                arg = alias.get(arg, arg)
-            else:
-                arg = "--add"
-            prop = arg[2:].replace("-", "_")
-
-            # bool
-            if arg in [
-                "--clone",
-                "--cosmo",
-                "--debug",
-                "--dry-run",
-                "--help",
-                "--version",
-            ]:
-                setattr(args, prop, True)
-
-            # str
-            elif arg in [
-                "--args",
-                "--python-url",
-                "--receipt-url",
-                "--release-url",
-                "--release-version",
-            ]:
-                if not argv:
-                    raise ValueError(f"Expected argument for option: {arg}")
-                setattr(args, prop, argv.pop(0))
-
-            # path
-            elif arg in ["--cache", "--output", "--receipt"]:
-                if not argv:
-                    raise ValueError(f"Expected argument for option: {arg}")
-                setattr(args, prop, Path(argv.pop(0)))
-
-            # list[str]
-            elif arg in ["--add", "--exclude", "--remove"]:
-                if not argv:
-                    raise ValueError(f"Expected argument for option: {arg}")
-                getattr(args, prop).append(argv.pop(0))
-
-            # unknown
-            else:
+        i, n = 0, len(argv)
+        while i < n:
+            arg = argv[i]
+            spec = OPTIONS.get(arg)
+            if spec:
+                i += 1
+            elif arg.startswith("-"):
                 raise ValueError(f"Unknown option: {arg}")
+            else:  # run of positional paths; add them all at once
+                j = i + 1
+                while j < n and not argv[j].startswith("-"):
+                    j += 1
+                args.add.extend(argv[i:j])
+                i = j
+                continue
+            kind, prop = spec
+
+            if kind == KIND_BOOL:
+                setattr(args, prop, True)
+                continue
+
+            if i == n:
+                raise ValueError(f"Expected argument for option: {arg}")
+            value = argv[i]
+            i += 1
+            if kind == KIND_STR:
+                setattr(args, prop, value)
+            elif kind == KIND_INT:
+                if not (value.isascii() and value.isdecimal()):
+                    raise ValueError(f"Expected integer for option: {arg}")
+                setattr(args, prop, int(value))
+            elif kind == KIND_PATH:
+                setattr(args, prop, Path(value))
+            else:  # list[str]
+                getattr(args, prop).append(value)
+
+        # patterns (keep first occurrence)
+        args.add = list(dict.fromkeys(args.add))
+        args.exclude = list(dict.fromkeys(args.exclude))
+        args.remove = list(dict.fromkeys(args.remove))
 
         # cache
-        if args.cache and args.cache.name.lower() in ["0", "false"]:
+        if args.cache and args.cache.name.lower() in NO_CACHE:
             args.cache = None
 
+        # output
+        if not 0 <= args.compress_level <= 9:
+            raise ValueError("--compress-level must be between 0 and 9")
+        if args.jobs > MAX_JOBS:
+            raise ValueError(f"--jobs must be between 0 and {MAX_JOBS}")
+
         # self-updater
         if args.add_updater and not args.receipt_url and not args.release_url:
             raise ValueError("--receipt-url or --release-url required for updater")
@@ -2,17 +2,25 @@
 
 # std
 from __future__ import annotations
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import MAGIC_NUMBER
 from pathlib import Path
-from shlex import split
 from typing import Dict
+from typing import FrozenSet
 from typing import Iterator
+from typing import List
 from typing import Optional
 from typing import Set
 from typing import Tuple
 from typing import Union
+import fnmatch
+import hashlib
 import io
 import logging
+import mmap
 import os
+import re
 import shlex
 import shutil
 import sys
@@ -20,57 +28,278 @@ import tempfile
 import zipfile
 
 # pkg
+from . import __version__
 from .args import Args
+from .args import DEFAULT_COMPRESS_LEVEL
 from .downloader import download
 from .downloader import download_if_newer
 from .downloader import move_executable
 from .pythonoid import compile_python
 from .pythonoid import MAIN_FILES
+from .pythonoid import O_READ
 from .pythonoid import PACKAGE_FILES
+from .pythonoid import PYC_HEADER
 from .pythonoid import Pkg
 from .pythonoid import PythonArgs
+from .pythonoid import read_fd
+from .pythonoid import read_file
 from .pythonoid import RE_MAIN
 from .receipt import Receipt
 from .updater import PATH_COSMOFY
 from .updater import PATH_RECEIPT
+from .zipfile2 import Deflated
 from .zipfile2 import ZipFile2
 
 log = logging.getLogger(__name__)
 
+RE_GLOB = re.compile(r"[*?[]")
+"""Regex for characters that make a pattern a glob."""
 
-def _archive(path: Union[str, Path, io.BytesIO]) -> ZipFile2:
-    return ZipFile2(path, mode="a", compression=zipfile.ZIP_DEFLATED, compresslevel=9)
+RE_SHELL = re.compile(r"[\"'\\]")
+"""Regex for characters that `shlex.split` treats specially (quotes, escapes)."""
 
+RE_WORD = re.compile(r"[^ \t\r\n]+")
+"""Regex for a word between `shlex` whitespace."""
 
-def expand_globs(start: Path, *patterns: str) -> Iterator[Tuple[Path, Set[str]]]:
-    """Yield paths of all glob patterns."""
-    seen: Set[Path] = set()
+FICLONE = 0x40049409
+"""`ioctl` request to clone a file on copy-on-write filesystems (Linux)."""
+
+POOL_MIN_FILES = 8
+"""Minimum number of `.py` files to compile in a process pool."""
+
+MMAP_MIN_SIZE = 1 << 16
+"""Minimum size of a `.py` file to map into memory instead of reading it."""
+
+
+def split_args(args: str) -> List[str]:
+    """Split `args` like a shell would.
+
+    Most args (e.g., `-m foo`) have no quotes or escapes, so they are split
+    on whitespace without starting a `shlex` lexer.
+    """
+    return shlex.split(args) if RE_SHELL.search(args) else RE_WORD.findall(args)
+
+
+def _archive(
+    path: Union[str, Path, io.BytesIO], level: int = DEFAULT_COMPRESS_LEVEL
+) -> ZipFile2:
+    return ZipFile2(
+        path, mode="a", compression=zipfile.ZIP_DEFLATED, compresslevel=level
+    )
+
+
+def _cached_pyc(cache: Path, path: Path, stats: os.stat_result) -> Path:
+    """Return the path to cached bytecode for `path` as of `stats`."""
+    key = ":".join(
+        (
+            os.path.abspath(path),
+            str(stats.st_mtime_ns),
+            str(stats.st_size),
+            MAGIC_NUMBER.hex(),
+            str(sys.flags.optimize),
+            __version__,  # main detection may change between releases
+        )
+    )
+    return cache / f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.pyc"
+
+
+def _compile(path: Path, cache: Optional[Path] = None) -> Tuple[bool, bytearray]:
+    """Return whether `path` has a main section and its bytecode.
+
+    If `cache` is given, reuse (or save) the results in that folder.
+    Cached files are the main flag (1 byte) followed by the bytecode.
+
+    NOTE: This is a module-level function so it can run in a process pool.
+    """
+    if cache:
+        try:
+            cached, _ = read_file(_cached_pyc(cache, path, path.stat()))
+            if (
+                len(cached) >= 1 + PYC_HEADER.size
+                and cached[:1] in (b"\x00", b"\x01")
+                and cached[1:5] == MAGIC_NUMBER
+            ):
+                return cached[:1] == b"\x01", bytearray(cached[1:])
+            log.debug(f"ignoring invalid cached bytecode for {path}")
+        except OSError:  # not cached
+            pass
+
+    fd = os.open(path, O_READ)
+    try:
+        stats = os.fstat(fd)
+        data: Union[bytes, mmap.mmap]
+        if stats.st_size < MMAP_MIN_SIZE:
+            data = read_fd(fd, stats.st_size)
+        else:  # skip copying large files into memory
+            data = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+    try:
+        # cheap substring check before running the regex over the whole file
+        # NOTE: `in` checks for a single byte in `mmap`, so use `find`.
+        has_main = data.find(b"__main__") != -1 and RE_MAIN.search(data) is not None
+        code = compile_python(path, data, stats)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    if cache:
+        temp: Optional[Path] = None
+        try:
+            cache.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache, delete=False) as out:
+                temp = Path(out.name)
+                out.write(b"\x01" if has_main else b"\x00")
+                out.write(code)
+            os.replace(temp, _cached_pyc(cache, path, stats))  # atomic
+        except OSError as e:
+            log.debug(f"cannot cache {path}: {e}")
+            if temp:
+                temp.unlink(missing_ok=True)
+    return has_main, code
+
+
+def _copy_range(src_fd: int, dest_fd: int) -> None:
+    """Copy between file descriptors without leaving the kernel.
+
+    Raises `OSError` if `os.copy_file_range` is unavailable or unsupported
+    for these files.
+    """
+    copy_range = getattr(os, "copy_file_range", None)
+    if copy_range is None:
+        raise OSError("copy_file_range is not available")
+    remaining = os.fstat(src_fd).st_size
+    while remaining > 0:
+        copied = copy_range(src_fd, dest_fd, remaining)
+        if not copied:  # source got shorter
+            break
+        remaining -= copied
+
+
+def copy_file(src: Path, dest: Path) -> Path:
+    """Copy contents and mode of `src` to `dest`.
+
+    On filesystems that support it (e.g., btrfs, XFS), the file is cloned
+    instead of copied. Otherwise, on Linux, `copy_file_range` keeps the data
+    in the kernel (and may still share extents).
+    """
+    try:
+        import fcntl
+
+        with src.open("rb") as fsrc, dest.open("wb") as fdest:
+            try:
+                fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+            except OSError:
+                _copy_range(fsrc.fileno(), fdest.fileno())
+    except (ImportError, OSError):
+        shutil.copyfile(src, dest)
+    shutil.copymode(src, dest)
+    return dest
+
+
+def _walk(
+    top: str, prune: FrozenSet[str] = frozenset()
+) -> Iterator[Tuple[str, List[str]]]:
+    """Yield each directory under `top` (top-down) with its sorted file names.
+
+    Like `os.walk`, this does not descend into symlinked directories and
+    skips directories it cannot read, but it uses the file types cached
+    by `os.scandir` instead of calling `stat` on every entry.
+
+    Directories in `prune` are yielded without any files and not descended.
+    """
+    stack = [top]  # explicit stack: no recursion limit, no nested generators
+    while stack:
+        folder = stack.pop()
+        if folder in prune and folder != top:
+            yield folder, []
+            continue
+
+        dirs: List[str] = []
+        files: List[str] = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        files.append(entry.name)
+                    elif not entry.is_symlink():
+                        dirs.append(entry.path)
+        except OSError:
+            continue
+
+        yield folder, sorted(files)
+        stack.extend(sorted(dirs, reverse=True))  # pop in sorted order
+
+
+def _compile_deflated(
+    path: Path, level: Optional[int], cache: Optional[Path] = None
+) -> Tuple[bool, Deflated]:
+    """Like `_compile`, but also compress the bytecode for the archive.
+
+    NOTE: This lets pool workers do the compression, too.
+    """
+    has_main, data = _compile(path, cache)
+    return has_main, Deflated.compress(data, level)
+
+
+def match_globs(start: Path, *patterns: str) -> Iterator[Path]:
+    """Yield paths that match glob patterns (without searching directories)."""
     for pattern in patterns:
         if pattern == ".":
-            paths = [start]
+            yield start
         elif pattern == "..":
-            paths = [start.parent]
+            yield start.parent
+        elif not RE_GLOB.search(pattern):  # plain path; nothing to match
+            path = start / pattern
+            if path.exists():
+                yield path
         else:
-            paths = sorted(start.glob(pattern))
-
-        for path in paths:
-            if not path.is_dir():
-                if path not in seen:
-                    seen.add(path)
-                    yield (path, set())
-                continue
-
-            for dirname, _, files in os.walk(path):
-                folder = Path(dirname)
-                if folder not in seen:
-                    seen.add(folder)
-                    yield (folder, set(files))
-
-                for name in sorted(files):
-                    file = folder / name
-                    if file not in seen:
-                        seen.add(file)
-                        yield (file, set())
+            yield from sorted(start.glob(pattern))
+
+
+def expand_globs(
+    start: Path, *patterns: str, exclude: Optional[Set[Path]] = None
+) -> Iterator[Tuple[Path, Optional[Set[str]]]]:
+    """Yield paths of all glob patterns.
+
+    Directories are yielded with the names of their files; files with `None`.
+
+    Directories in `exclude` are yielded, but not searched. Paths inside
+    them are skipped.
+    """
+    seen: Set[str] = set()  # str hashes are cached; Path hashes are not
+    prune = frozenset(str(p) for p in exclude or ())
+    for path in match_globs(start, *patterns):
+        top = str(path)
+        if prune and not prune.isdisjoint(map(str, path.parents)):
+            continue  # inside an excluded directory
+        if not path.is_dir():
+            if top not in seen:
+                seen.add(top)
+                yield (path, None)
+            continue
+        if top in seen:  # already walked this whole tree
+            continue
+        if top in prune:
+            seen.add(top)
+            yield (path, set())
+            continue
+
+        for dirname, files in _walk(top, prune):
+            folder = Path(dirname)
+            if dirname not in seen:
+                seen.add(dirname)
+                yield (folder, set(files))
+
+            for name in files:
+                key = os.path.join(dirname, name)
+                if key not in seen:
+                    seen.add(key)
+                    yield (folder / name, None)
 
 
 class Bundler:
@@ -85,16 +314,22 @@ class Bundler:
     banner: str
     """Log prefix for dry-runs."""
 
+    pyc_cache: Optional[Path]
+    """Directory for caching compiled `.py` files (if any)."""
+
     def __init__(self, args: Args):
         """Construct a bundler."""
         self.args = args
         self.banner = "[DRY RUN] " if args.dry_run else ""
+        self.pyc_cache = None
+        if args.cache and args.cache_pyc and args.for_real:
+            self.pyc_cache = args.cache / "pyc"
 
     def fs_copy(self, src: Path, dest: Path) -> Path:
         """Copy a file from `src` to `dest`."""
         log.debug(f"{self.banner}copy: {src} to {dest}")
         if self.args.for_real:
-            shutil.copy(src, dest)
+            copy_file(src, dest)
         return dest
 
     def fs_move_executable(self, src: Path, dest: Path) -> Path:
@@ -113,103 +348,194 @@ class Bundler:
             download_if_newer(self.args.python_url, src)
 
         self.fs_copy(src, dest)
-        return archive or _archive(dest)
+        return archive or _archive(dest, self.args.compress_level)
 
     def from_download(self, dest: Path, archive: Optional[ZipFile2] = None) -> ZipFile2:
         """Download archive."""
         log.debug(f"{self.banner}download (fresh): {self.args.python_url} to {dest}")
         if self.args.for_real:
             download(self.args.python_url, dest)
-        return archive or _archive(dest)
+        return archive or _archive(dest, self.args.compress_level)
 
     def setup_temp(self) -> Tuple[Path, Optional[ZipFile2]]:
         """Setup a temporary file and construct a ZipFile (if non-dry-run)."""
         archive = None
         if self.args.for_real:
-            temp = Path(tempfile.NamedTemporaryFile(delete=False).name)
+            # NOTE: Same folder as the output so the final move is a rename.
+            output = self.args.output
+            folder = output.parent if output else Path.cwd()
+            folder.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=folder, prefix=".cosmofy-", delete=False
+            ) as f:
+                temp = Path(f.name)
         else:
             temp = Path(tempfile.gettempprefix()) / "DRY-RUN"
-            archive = _archive(io.BytesIO())
+            archive = _archive(io.BytesIO(), self.args.compress_level)
         return temp, archive
 
     def setup_archive(self) -> ZipFile2:
         """Clone, copy from cache, or download the archive."""
         temp, archive = self.setup_temp()
-        if self.args.clone:
-            paths = [".args", f"{PATH_COSMOFY}/*"]
-            self.fs_copy(Path(sys.executable), temp)
-            archive = self.zip_remove(archive or _archive(temp), *paths)
-        elif self.args.cache:
-            archive = self.from_cache(self.args.cache / "python", temp, archive)
-        else:
-            archive = self.from_download(temp, archive)
+        try:
+            if self.args.clone:
+                paths = [".args", f"{PATH_COSMOFY}/*"]
+                self.fs_copy(Path(sys.executable), temp)
+                archive = self.zip_remove(
+                    archive or _archive(temp, self.args.compress_level), *paths
+                )
+            elif self.args.cache:
+                archive = self.from_cache(self.args.cache / "python", temp, archive)
+            else:
+                archive = self.from_download(temp, archive)
+        except BaseException:  # don't leave the temp file in the output folder
+            if self.args.for_real:
+                temp.unlink(missing_ok=True)
+            raise
         return archive
 
     def process_file(
-        self, path: Path, module: Pkg, main: Pkg
-    ) -> Tuple[str, Union[bytes, bytearray], Pkg]:
-        """Search for main module and compile `.py` files."""
-        name, data = path.name, path.read_bytes()
+        self,
+        path: Path,
+        module: Pkg,
+        main: Pkg,
+        compiled: Optional[Tuple[bool, Union[bytearray, Deflated]]] = None,
+    ) -> Tuple[str, Union[bytes, bytearray, Deflated], Pkg]:
+        """Search for main module and compile `.py` files.
+
+        If given, `compiled` is the result of `_compile(path)` or
+        `_compile_deflated(path, ...)`.
+        """
+        name = path.name
         if not main and name in MAIN_FILES:
             main = module[:-1]
             log.debug(f"found main: {main}")
 
         # NOTE: We only work on .py files because .pyc files are not searchable.
+        data: Union[bytes, bytearray, Deflated]
         if path.suffix == ".py":
-            if not main and RE_MAIN.search(data):
+            has_main, data = compiled or _compile(path, self.pyc_cache)
+            if not main and has_main:
                 main = module
                 log.debug(f"found main: {main}")
             name = path.with_suffix(".pyc").name  # change name
-            data = compile_python(path, data)
+        else:
+            data, _ = read_file(path)
         return name, data, main
 
     def zip_add(
         self,
         archive: ZipFile2,
-        include: Iterator[Tuple[Path, Set[str]]],
+        include: Iterator[Tuple[Path, Optional[Set[str]]]],
         exclude: Set[Path],
     ) -> Pkg:
         """Add files to `archive` while searching for `main` entry point."""
         modules: Dict[Path, Pkg] = {}
         main: Pkg = tuple()
+        first: Pkg = tuple()  # fallback main: first module we saw
         pkgs = ("Lib", "site-packages")
-        for path, files in include:
-            if path in exclude:
-                log.debug(f"{self.banner}exclude: {path}")
-                continue
-            if path.is_dir():
-                if any(True for p in PACKAGE_FILES if p in files):
-                    modules[path] = modules.get(path.parent, tuple()) + (path.name,)
-                continue
-            # path is a file
-
-            parent = modules.get(path.parent, tuple())
-            if not parent and path.name in PACKAGE_FILES:
-                parent = (path.parent.name,)
-            modules[path] = module = parent + (path.stem,)
-
-            name, data, main = self.process_file(path, module, main)
-            dest = "/".join(pkgs + parent + (name,))
-            log.info(f"{self.banner}add: {dest}")
-            if self.args.for_real:
-                archive.add_file(dest, data, 0o644)
+        plan: List[Tuple[Path, Pkg, str]] = []  # (path, module, dest prefix)
+        prefixes: Dict[Pkg, str] = {}  # parent => dest prefix
+
+        # hoisted out of the loops below
+        banner, for_real, add_file = self.banner, self.args.for_real, archive.add_file
+        debug_on = log.isEnabledFor(logging.DEBUG)
+        info_on = log.isEnabledFor(logging.INFO)
+
+        # Once there are enough `.py` files, compile them in a process pool
+        # while we keep walking; workers also compress the bytecode.
+        # NOTE: Cosmopolitan python prepends `.args` to every invocation,
+        # so it cannot start worker processes.
+        level, cache = archive.compresslevel, self.pyc_cache
+        jobs = self.args.jobs
+        use_pool = not self.args.cosmo and jobs != 1
+        pool: Optional[ProcessPoolExecutor] = None
+        sources: List[Path] = []
+        compiled: Dict[Path, Future[Tuple[bool, Deflated]]] = {}
 
-        if not main and modules.values():
-            main = next(iter(modules.values()))
-        return main
+        try:
+            # files usually follow their folder, so remember its package
+            folder: str = ""
+            folder_pkg: Pkg = tuple()
+            for path, files in include:
+                if path in exclude:
+                    if debug_on:
+                        log.debug(f"{banner}exclude: {path}")
+                    continue
+                if files is not None:  # path is a directory
+                    if not PACKAGE_FILES.isdisjoint(files):
+                        modules[path] = modules.get(path.parent, tuple()) + (path.name,)
+                        first = first or modules[path]
+                    folder, folder_pkg = str(path), modules.get(path, tuple())
+                    continue
+                # path is a file
+
+                if os.path.dirname(str(path)) == folder:
+                    parent = folder_pkg
+                else:
+                    parent = modules.get(path.parent, tuple())
+                if not parent and path.name in PACKAGE_FILES:
+                    parent = (path.parent.name,)
+                modules[path] = module = parent + (path.stem,)
+                first = first or module
+                prefix = prefixes.get(parent)
+                if prefix is None:
+                    prefix = prefixes[parent] = "/".join(pkgs + parent) + "/"
+                plan.append((path, module, prefix))
+
+                if path.suffix != ".py":
+                    continue
+                sources.append(path)
+                if pool:
+                    compiled[path] = pool.submit(_compile_deflated, path, level, cache)
+                elif use_pool and len(sources) >= POOL_MIN_FILES:
+                    log.debug("compiling in a process pool")
+                    pool = ProcessPoolExecutor(jobs or None)
+                    for source in sources:
+                        compiled[source] = pool.submit(
+                            _compile_deflated, source, level, cache
+                        )
+
+            # add to the archive in order (results arrive as they are needed)
+            for path, module, prefix in plan:
+                future = compiled.get(path)
+                result = future.result() if future else None
+                name, data, main = self.process_file(path, module, main, result)
+                dest = prefix + name
+                if info_on:
+                    log.info(f"{banner}add: {dest}")
+                if for_real:
+                    add_file(dest, data, 0o644)
+        except BaseException:
+            if pool:  # don't wait for work we no longer need
+                if sys.version_info >= (3, 9):
+                    pool.shutdown(cancel_futures=True)
+                else:  # pragma: no cover
+                    for future in compiled.values():
+                        future.cancel()
+                    pool.shutdown()
+            raise
+        if pool:
+            pool.shutdown()
+
+        return main or first
 
     def zip_remove(self, archive: ZipFile2, *patterns: str) -> ZipFile2:
         """Remove glob patterns from the archive."""
         for pattern in patterns:
             log.info(f"{self.banner}remove: {pattern}")
-            if self.args.for_real:
-                archive.remove(pattern)
+        if self.args.for_real and patterns:
+            # one pass over the archive for all the patterns
+            match = re.compile("|".join(fnmatch.translate(p) for p in patterns)).match
+            archive.remove_members(
+                item for item in archive.filelist if match(item.filename)
+            )
         return archive
 
     def add_updater(self, archive: ZipFile2, python_args: str, receipt: Receipt) -> str:
         """Add `cosmofy.updater` and `receipt` to `archive`."""
         try:
-            PythonArgs.parse(split(python_args))  # we can handle these args
+            PythonArgs.parse(split_args(python_args))  # we can handle these args
             python_args = f"-m cosmofy.updater {python_args}".strip()
         except ValueError as e:
             log.error(f"Cannot add updater: {e}")
@@ -232,24 +558,30 @@ class Bundler:
             "receipt.py",
             "updater.py",
         ]
-        for file in files:
-            dest = f"{PATH_COSMOFY}/{file}c"
-            if archive.NameToInfo.get(dest):  # already done
-                log.debug(f"{self.banner}already exists: {dest}")
-                continue
-
-            if self.args.cosmo:  # clone from self
-                log.debug(f"{self.banner}clone from: {sys.executable}")
-                bundle = ZipFile2(sys.executable, "r")
-                data = bundle.read(dest)
-            else:
-                path = Path(__file__).parent / file
-                log.debug(f"{self.banner}compile from: {path}")
-                data = compile_python(path)
-
-            log.info(f"{self.banner}add: {dest}")
-            if self.args.for_real:
-                archive.add_file(dest, data, 0o644)
+        package = Path(__file__).parent
+        bundle: Optional[ZipFile2] = None  # opened at most once
+        try:
+            for file in files:
+                dest = f"{PATH_COSMOFY}/{file}c"
+                if archive.NameToInfo.get(dest):  # already done
+                    log.debug(f"{self.banner}already exists: {dest}")
+                    continue
+
+                if self.args.cosmo:  # clone from self
+                    log.debug(f"{self.banner}clone from: {sys.executable}")
+                    bundle = bundle or ZipFile2(sys.executable, "r")
+                    data = bundle.read(dest)
+                else:
+                    path = package / file
+                    log.debug(f"{self.banner}compile from: {path}")
+                    data = compile_python(path)
+
+                log.info(f"{self.banner}add: {dest}")
+                if self.args.for_real:
+                    archive.add_file(dest, data, 0o644)
+        finally:
+            if bundle:
+                bundle.close()
 
         return python_args
 
@@ -268,7 +600,7 @@ class Bundler:
         if python_args:
             log.debug(f"{self.banner}.args = {python_args}")
             if self.args.for_real:
-                archive.add_file(".args", "\n".join(shlex.split(python_args)), 0o644)
+                archive.add_file(".args", "\n".join(split_args(python_args)), 0o644)
         return receipt
 
     def write_output(self, archive: ZipFile2, main: Pkg) -> Path:
@@ -307,14 +639,22 @@ class Bundler:
     def run(self) -> Path:
         """Run the bundler."""
         archive = self.setup_archive()
-        include = expand_globs(Path.cwd(), *self.args.add)
-        exclude = set(p[0] for p in expand_globs(Path.cwd(), *self.args.exclude))
-        main = self.zip_add(archive, include, exclude)
-        self.zip_remove(archive, *self.args.remove)
-        receipt = self.write_args(archive, main)
-        archive.close()  # release the file
-
-        output = self.write_output(archive, main)
+        try:
+            exclude = set(match_globs(Path.cwd(), *self.args.exclude))
+            include = expand_globs(Path.cwd(), *self.args.add, exclude=exclude)
+            main = self.zip_add(archive, include, exclude)
+            self.zip_remove(archive, *self.args.remove)
+            receipt = self.write_args(archive, main)
+            archive.close()  # release the file
+
+            output = self.write_output(archive, main)
+        except BaseException:  # don't leave the temp file in the output folder
+            try:
+                archive.close()
+            finally:
+                if self.args.for_real and archive.filename:
+                    Path(archive.filename).unlink(missing_ok=True)
+            raise
         if self.args.add_updater:  # published receipt
             receipt = self.write_receipt(output, receipt)
         return output
@@ -3,6 +3,7 @@
 # std
 from datetime import datetime
 from datetime import timezone
+from email.utils import format_datetime
 from email.utils import parsedate_to_datetime
 from http.client import HTTPResponse
 from pathlib import Path
@@ -11,21 +12,21 @@ from typing import Optional
 from urllib.error import HTTPError
 from urllib.request import Request
 from urllib.request import urlopen
+import errno
 import hashlib
 import logging
+import os
 import shutil
 import stat
 import tempfile
 
 # pkg
+from . import CHUNK_SIZE
 from .receipt import DEFAULT_HASH
 from .receipt import Receipt
 
 log = logging.getLogger(__name__)
 
-CHUNK_SIZE = 65536
-"""Default chunk size."""
-
 
 def move_executable(src: Path, dest: Path) -> Path:
     """Set the executable bit and move a file."""
@@ -33,44 +34,71 @@ def move_executable(src: Path, dest: Path) -> Path:
     src.chmod(mode)
 
     dest.parent.mkdir(parents=True, exist_ok=True)
-    # TODO 2024-10-31 @ py3.8 EOL: use `Path` instead of `str`
-    shutil.move(str(src), str(dest))
+    try:
+        os.replace(src, dest)  # atomic rename on the same filesystem
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # TODO 2024-10-31 @ py3.8 EOL: use `Path` instead of `str`
+        shutil.move(str(src), str(dest))  # copy across filesystems
     return dest
 
 
-def progress(response: HTTPResponse, prefix: str = "Downloading: ") -> Iterator[bytes]:
-    """Display progress information."""
+def progress(
+    response: HTTPResponse, prefix: str = "Downloading: "
+) -> Iterator[memoryview]:
+    """Display progress information.
+
+    Chunks share one buffer, so each must be used before the next is read.
+    """
     header = response.getheader("Content-Length") or "0"
     total = int(header.strip())
     done = 0
-    while chunk := response.read(CHUNK_SIZE):
-        done += len(chunk)
+    buffer = memoryview(bytearray(CHUNK_SIZE))
+    while size := response.readinto(buffer):
+        done += size
         percent = done / total * 100
         print(f"\r{prefix}{percent:.2f}%", end="", flush=True)
-        yield chunk
+        yield buffer[:size]
     print("")
 
 
-def download(url: str, path: Path) -> Path:
-    """Download `url` to path."""
-    log.info(f"Download {url} to {path}")
+def save(response: HTTPResponse, path: Path) -> Path:
+    """Write the body of `response` to `path`."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with urlopen(url) as response, path.open("wb") as output:
+    with path.open("wb") as output:
         for chunk in progress(response):
             output.write(chunk)
     return path
 
 
+def download(url: str, path: Path) -> Path:
+    """Download `url` to path."""
+    log.info(f"Download {url} to {path}")
+    with urlopen(url) as response:
+        return save(response, path)
+
+
 def download_if_newer(url: str, path: Path) -> Path:
     """Download `url` to `path` if `url` is newer."""
-    exists = path.exists()
-    need_download = not exists  # guess: exists => already downloaded
-    if exists:
-        local = datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
-        response = urlopen(Request(url, method="HEAD"))
-        remote = parsedate_to_datetime(response.headers.get("Last-Modified"))
-        need_download = remote > local  # only download if newer
-    return download(url, path) if need_download else path
+    if not path.exists():
+        return download(url, path)
+
+    # conditional GET: the server answers 304 if we're up-to-date
+    local = datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
+    request = Request(url, headers={"If-Modified-Since": format_datetime(local, True)})
+    try:
+        with urlopen(request) as response:
+            # some servers ignore the condition and always send the body
+            modified = response.headers.get("Last-Modified")
+            if modified and parsedate_to_datetime(modified) <= local:
+                return path
+            log.info(f"Download {url} to {path}")
+            return save(response, path)
+    except HTTPError as e:
+        if e.code == 304:  # not modified
+            return path
+        raise
 
 
 def download_and_hash(url: str, path: Path, algo: str = DEFAULT_HASH) -> str:
@@ -101,12 +129,17 @@ def download_release(
 ) -> Optional[Path]:
     """Download release from `url` checking the hash along the way."""
     log.info(f"Download {url} to {path}")
-    with tempfile.NamedTemporaryFile(delete=False) as out:
+    # next to `path` so that the final move is a rename
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".part", delete=False
+    ) as out:
         temp = Path(out.name)
+    try:
         try:
             received = download_and_hash(url, temp, algo)
         except HTTPError as e:
             log.error(f"{e}: {url}")
+            temp.unlink(missing_ok=True)
             return None
 
         if received != expected:
@@ -114,5 +147,8 @@ def download_release(
             temp.unlink(missing_ok=True)
             return None
 
-    log.debug(f"Overwriting: {path}")
-    return move_executable(temp, path)
+        log.debug(f"Overwriting: {path}")
+        return move_executable(temp, path)
+    except BaseException:  # don't leave partial downloads next to `path`
+        temp.unlink(missing_ok=True)
+        raise
@@ -3,6 +3,7 @@
 
 # std
 from __future__ import annotations
+from collections import deque
 from importlib._bootstrap_external import SourceFileLoader  # type: ignore
 from importlib.util import MAGIC_NUMBER
 from os import environ as ENV
@@ -16,8 +17,11 @@ import code as repl
 import dataclasses
 import logging
 import marshal
+import mmap
+import os
 import re
 import runpy
+import struct
 import sys
 import traceback
 
@@ -33,10 +37,10 @@ MODULE_SUFFIXES = (".py", ".pyc")
 PACKAGE_STEMS = ("__init__", "__main__")
 """File stems that indicate a python package."""
 
-PACKAGE_FILES = tuple(p + s for p in PACKAGE_STEMS for s in MODULE_SUFFIXES)
+PACKAGE_FILES = frozenset(p + s for p in PACKAGE_STEMS for s in MODULE_SUFFIXES)
 """File names that indicate a python package."""
 
-MAIN_FILES = ("__main__.py", "__main__.pyc")
+MAIN_FILES = frozenset(("__main__.py", "__main__.pyc"))
 """File names that indicate python package has a main."""
 
 RE_MAIN = re.compile(
@@ -50,31 +54,79 @@ RE_MAIN = re.compile(
 """Regex for detecting a main section in `bytes`."""
 
 
-# https://github.com/python/cpython/blob/3.12/Lib/importlib/_bootstrap_external.py#L79C1-L81C55
-def _pack_uint32(x: Union[int, float]) -> bytes:
-    """Convert a 32-bit integer to little-endian."""
-    return (int(x) & 0xFFFFFFFF).to_bytes(4, "little")
+O_READ = os.O_RDONLY | getattr(os, "O_BINARY", 0)
+"""Flags for `os.open` to read a file (binary mode on Windows)."""
 
+PYC_HEADER = struct.Struct("<4sIII")
+"""Header of a `.pyc` file: magic, flags, mtime, source size (little-endian)."""
 
-def compile_python(path: Path, source: Optional[bytes] = None) -> bytearray:
-    """Return the bytecode."""
-    source = path.read_bytes() if source is None else source
-    stats = path.stat()
-    mtime = stats.st_mtime
-    source_size = stats.st_size
+
+def read_fd(fd: int, size: int) -> bytes:
+    """Read all of `fd`, which we expect to have `size` bytes.
+
+    Usually this is a single `read` (asking for 1 extra byte to detect EOF).
+    """
+    data = os.read(fd, size + 1)
+    if len(data) != size:  # short read or file changed; drain the rest
+        parts = [data]
+        while chunk := os.read(fd, 1 << 16):
+            parts.append(chunk)
+        data = b"".join(parts)
+    return data
+
+
+def read_file(path: Path) -> Tuple[bytes, os.stat_result]:
+    """Return the contents and stats of `path` without a buffered file object."""
+    fd = os.open(path, O_READ)
+    try:
+        stats = os.fstat(fd)
+        return read_fd(fd, stats.st_size), stats
+    finally:
+        os.close(fd)
+
+
+def compile_python(
+    path: Path,
+    source: Optional[Union[bytes, mmap.mmap]] = None,
+    stats: Optional[os.stat_result] = None,
+) -> bytearray:
+    """Return the bytecode.
+
+    Pass `source` and `stats` if you already have them to skip reading the file.
+    """
+    if source is None:
+        source, read_stats = read_file(path)
+        stats = stats or read_stats
+    stats = stats or path.stat()
 
     # https://github.com/python/cpython/blob/3.12/Lib/importlib/_bootstrap_external.py#L1059
     code = compile(source, path, "exec", dont_inherit=True, optimize=-1)
 
     # https://github.com/python/cpython/blob/3.12/Lib/importlib/_bootstrap_external.py#L764
-    data = bytearray(MAGIC_NUMBER)
-    data.extend(_pack_uint32(0))
-    data.extend(_pack_uint32(mtime))
-    data.extend(_pack_uint32(source_size))
-    data.extend(marshal.dumps(code))
+    # NOTE: Values are truncated to 32 bits like importlib's `_pack_uint32`.
+    body = marshal.dumps(code)
+    data = bytearray(PYC_HEADER.size + len(body))  # allocate once
+    PYC_HEADER.pack_into(
+        data,
+        0,
+        MAGIC_NUMBER,
+        0,
+        int(stats.st_mtime) & 0xFFFFFFFF,
+        stats.st_size & 0xFFFFFFFF,
+    )
+    data[PYC_HEADER.size :] = body
     return data
 
 
+UNSUPPORTED = frozenset(
+    """
+    --help-env --help-xoptions --help-all
+    -b -B --check-hash-based-pycs -d -E -I -O -OO -P -R
+    -s -S -u -v -W -x -X
+    """.split()
+)
+"""Valid python options that `PythonArgs` does not support."""
+
 # https://github.com/python/cpython/blob/32119fc377a4d9df524a7bac02b6922a990361dd/Python/initconfig.c#L233
 USAGE = f"""\
 usage: {Path(__file__).name} [option] ... [-c cmd | -m mod | file | -] [arg] ...
@@ -136,39 +188,33 @@ class PythonArgs:
     def parse(argv: List[str]) -> PythonArgs:
         """Parse a subset of python command-line args."""
         args = PythonArgs()
-        UNSUPPORTED = """
-            --help-env --help-xoptions --help-all
-            -b -B --check-hash-based-pycs -d -E -I -O -OO -P -R
-            -s -S -u -v -W -x -X
-        """.split()
-        while argv:
-            arg = argv.pop(0)
+        rest = deque(argv)  # O(1) pops from the front; caller's list untouched
+        while rest:
+            arg = rest.popleft()
             if arg.startswith("--"):
                 pass
             elif arg.startswith("-") and len(arg) > 2:  # expand
-                argv = [f"-{a}" for a in arg[1:]] + argv
+                rest.extendleft(f"-{a}" for a in reversed(arg[1:]))
                 continue
 
-            if arg in ["-c", "-m"]:  # flags with an argument
-                if not argv:
+            if arg in {"-c", "-m"}:  # flags with an argument
+                if not rest:
                     raise ValueError(f"Argument expected for the {arg} option")
-                setattr(args, arg[1:], argv.pop(0))
-                args.argv += argv  # whatever is left
+                setattr(args, arg[1:], rest.popleft())
                 # NOTE: for -m it should be the full path to the module
-                args.argv.insert(0, arg)
+                args.argv = [arg, *rest]  # whatever is left
                 break  # remainder are argv
-            elif arg in ["-?", "-h", "--help"]:
+            elif arg in {"-?", "-h", "--help"}:
                 args.h = True
-            elif arg in ["-i", "-q"]:  # <bool> flags
+            elif arg in {"-i", "-q"}:  # <bool> flags
                 setattr(args, arg[1:], True)
-            elif arg in ["-"]:
+            elif arg == "-":
                 args.c = sys.stdin.read()
                 if sys.stdin.isatty():
                     args.i = True
-                args.argv += argv  # whatever is left
-                args.argv.insert(0, "-")
+                args.argv = ["-", *rest]  # whatever is left
                 break  # remainder are argv
-            elif arg in ["-V", "--version"]:
+            elif arg in {"-V", "--version"}:
                 if args.V:
                     args.VV = True
                 else:
@@ -179,8 +225,8 @@ class PythonArgs:
                 raise ValueError(f"Unknown option: {arg}")
             else:  # <script>
                 args.script = arg
-                args.argv += argv
-                args.argv.insert(0, arg)  # "script name as given on the command line"
+                # "script name as given on the command line"
+                args.argv = [arg, *rest]
                 break  # remainder are argv
 
         if not any([args.c, args.h, args.i, args.m, args.V, args.script]):
@@ -10,11 +10,16 @@ from typing import Dict
 from typing import List
 from urllib.request import urlopen
 import dataclasses
+import errno
 import hashlib
 import json
 import re
 import subprocess
 
+# pkg
+from . import CHUNK_SIZE
+from . import SLOTS
+
 Checker = Callable[[str], bool]
 """Function that takes a `str` and returns a `bool` if it is ok."""
 
@@ -26,14 +31,35 @@ RECEIPT_SCHEMA = (
 RECEIPT_KIND = ("embedded", "published")
 """Valid values for `Receipt.kind`."""
 
-RECEIPT_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$")
-"""Regex to validate `Receipt.date`."""
+RECEIPT_DATE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z", re.ASCII)
+"""Regex to validate `Receipt.date` (use `fullmatch`)."""
+
+RECEIPT_ALGO = re.compile(r"[a-z0-9-_]+", re.ASCII)
+"""Regex to validate `Receipt.algo` (use `fullmatch`)."""
+
+RECEIPT_HASH = re.compile(r"[a-f0-9]+", re.ASCII)
+"""Regex to validate `Receipt.hash` (use `fullmatch`)."""
 
-RECEIPT_ALGO = re.compile(r"^[a-z0-9-_]+$")
-"""Regex to validate `Receipt.algo`."""
+RECEIPT_RULES: Dict[str, Checker] = {
+    "$schema": lambda v: v == RECEIPT_SCHEMA,
+    "kind": lambda v: v in RECEIPT_KIND,
+    "date": lambda v: RECEIPT_DATE.fullmatch(v) is not None,
+    "algo": lambda v: RECEIPT_ALGO.fullmatch(v) is not None,
+    "hash": lambda v: RECEIPT_HASH.fullmatch(v) is not None,
+    "receipt_url": lambda v: bool(v.strip()),
+    "release_url": lambda v: bool(v.strip()),
+    "version": lambda v: bool(v.strip()),
+}
+"""Checks for each field of a published receipt."""
 
-RECEIPT_HASH = re.compile(r"^[a-f0-9]+$")
-"""Regex to validate `Receipt.hash`."""
+RECEIPT_EMBEDDED: Dict[str, Checker] = {
+    "hash": lambda v: isinstance(v, str),
+    "version": lambda v: isinstance(v, str),
+}
+"""Relaxed checks for fields that an embedded receipt may leave empty."""
+
+RECEIPT_MAX_SIZE = 1 << 16
+"""Largest receipt we are willing to download (64 KiB)."""
 
 DEFAULT_HASH = "sha256"
 """Default hashing algorithm."""
@@ -48,10 +74,38 @@ def datestr(date: datetime) -> str:
     >>> datestr(datetime(2000, 1, 1, tzinfo=timezone.utc))
     '2000-01-01T00:00:00Z'
     """
-    return date.astimezone(timezone.utc).isoformat()[:19] + "Z"
-
-
-@dataclasses.dataclass
+    return date.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def file_hash(path: Path, algo: str = DEFAULT_HASH) -> str:
+    """Return the hex digest of `path` without reading it all into memory."""
+    with path.open("rb", buffering=0) as f:
+        if hasattr(hashlib, "file_digest"):  # python >= 3.11
+            return hashlib.file_digest(f, algo).hexdigest()
+
+        digest = hashlib.new(algo)
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        while size := f.readinto(buffer):
+            digest.update(view[:size])
+        return digest.hexdigest()
+
+
+def probe_version(path: Path) -> subprocess.Popen[bytes]:
+    """Start `<path> --version` in the background and return the process."""
+    cmd = [str(path.resolve()), "--version"]  # no shell in between
+    try:
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        if e.errno != errno.ENOEXEC:
+            raise
+    # without an APE loader, the kernel only sees a shell script
+    return subprocess.Popen(
+        ["sh"] + cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+
+@dataclasses.dataclass(**SLOTS)
 class Receipt:
     """Asset metadata."""
 
@@ -61,8 +115,10 @@ class Receipt:
     kind: str = RECEIPT_KIND[0]
     """Whether this receipt is full (published) or partial (embedded)."""
 
-    date: str = datestr(datetime.now())
-    """UTC date/time of this receipt."""
+    date: str = dataclasses.field(
+        default_factory=lambda: datestr(datetime.now(timezone.utc))
+    )
+    """UTC date/time of this receipt (defaults to when it was created)."""
 
     algo: str = DEFAULT_HASH
     """Hashing algorithm."""
@@ -84,8 +140,8 @@ class Receipt:
         return self.date > other.date
 
     def __str__(self) -> str:
-        """Return `json`-encoded string."""
-        return json.dumps(self.asdict())
+        """Return compact `json`-encoded string."""
+        return json.dumps(self.asdict(), separators=(",", ":"))
 
     def asdict(self) -> Dict[str, str]:
         """Return `dict` representation of the receipt."""
@@ -101,37 +157,30 @@ class Receipt:
         }
 
     def is_valid(self) -> bool:
-        """Return `True` if there are no issues with the receipt."""
-        issues = Receipt.find_issues(self.asdict())
-        return not sum((v for v in issues.values()), [])
+        """Return `True` if there are no issues with the receipt.
+
+        Unlike `find_issues`, this stops at the first failed rule.
+        """
+        embedded = self.kind == "embedded"
+        for name, rule in RECEIPT_RULES.items():
+            if embedded and name in RECEIPT_EMBEDDED:
+                rule = RECEIPT_EMBEDDED[name]
+            if not rule(getattr(self, name.lstrip("$"))):  # $schema => schema
+                return False
+        return True
 
     @staticmethod
     def find_issues(data: Dict[str, str]) -> Dict[str, List[str]]:
         """Return field names by issue that occurred during validation."""
         issues: Dict[str, List[str]] = {"missing": [], "unknown": [], "malformed": []}
-        rules: Dict[str, Checker] = {
-            "$schema": lambda v: v == RECEIPT_SCHEMA,
-            "kind": lambda v: v in RECEIPT_KIND,
-            "date": lambda v: bool(RECEIPT_DATE.match(v)),
-            "algo": lambda v: bool(RECEIPT_ALGO.match(v)),
-            "hash": lambda v: bool(RECEIPT_HASH.match(v)),
-            "receipt_url": lambda v: bool(v.strip()),
-            "release_url": lambda v: bool(v.strip()),
-            "version": lambda v: bool(v.strip()),
-        }
-        embedded: Dict[str, Checker] = {
-            "hash": lambda v: isinstance(v, str),
-            "version": lambda v: isinstance(v, str),
-        }
-
         kind = data.get("kind", "embedded")
-        issues["unknown"] = [name for name in data if name not in rules]
-        for name, rule in rules.items():
+        issues["unknown"] = [name for name in data if name not in RECEIPT_RULES]
+        for name, rule in RECEIPT_RULES.items():
             if name not in data:
                 issues["missing"].append(name)
                 continue
-            if name in embedded and kind == "embedded":
-                rule = embedded[name]
+            if name in RECEIPT_EMBEDDED and kind == "embedded":
+                rule = RECEIPT_EMBEDDED[name]
             if not rule(data[name]):
                 issues["malformed"].append(name)
         return issues
@@ -152,7 +201,7 @@ class Receipt:
     def from_dict(data: Dict[str, str]) -> Receipt:
         """Return receipt from a `dict`."""
         issues = Receipt.find_issues(data)
-        if sum((v for v in issues.values()), []):
+        if any(issues.values()):
             raise ValueError("Invalid receipt", issues)
 
         schema = data["$schema"]
@@ -163,15 +212,22 @@ class Receipt:
     def from_url(url: str) -> Receipt:
         """Return a Receipt from a URL."""
         with urlopen(url) as response:
-            return Receipt.from_dict(json.load(response))
+            data = response.read(RECEIPT_MAX_SIZE + 1)  # don't read forever
+        if len(data) > RECEIPT_MAX_SIZE:
+            raise ValueError(f"Receipt larger than {RECEIPT_MAX_SIZE} bytes", url)
+        return Receipt.from_dict(json.loads(data))
 
     @staticmethod
     def from_path(path: Path, version: str = "", algo: str = DEFAULT_HASH) -> Receipt:
         """Return hash and version for a `path`."""
-        digest = hashlib.new(algo, path.read_bytes()).hexdigest()
-        if not version:
-            cmd = (f"{path.resolve()} --version",)
-            out = subprocess.run(cmd, capture_output=True, check=True, shell=True)
-            if match := RE_VERSION.search(out.stdout):
-                version = match.group().decode("utf-8")
+        if version:
+            return Receipt(algo=algo, hash=file_hash(path, algo), version=version)
+
+        with probe_version(path) as proc:  # runs while we hash
+            digest = file_hash(path, algo)
+            out, err = proc.communicate()
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args, out, err)
+        if match := RE_VERSION.search(out):
+            version = match.group().decode("utf-8")
         return Receipt(algo=algo, hash=digest, version=version)
@@ -9,8 +9,11 @@ from typing import List
 from typing import Optional
 import json
 import logging
+import os
+import struct
 import sys
 import zipfile
+import zlib
 
 # pkg
 from . import __pubdate__
@@ -31,6 +34,15 @@ PATH_COSMOFY = "Lib/site-packages/cosmofy"
 PATH_RECEIPT = f"{PATH_COSMOFY}/.cosmofy.json"
 """Path within the zip file to the local receipt."""
 
+ZIP_END = struct.Struct("<4s4H2LH")
+"""Zip end of central directory record."""
+
+ZIP_CENTRAL = struct.Struct("<4s6H3L5H2L")
+"""Zip central directory file header."""
+
+ZIP_LOCAL = struct.Struct("<4s5H3L2H")
+"""Zip local file header."""
+
 USAGE = f"""\
 This program is bundled into Cosmopolitan Python apps
 to give them the ability to update themselves.
@@ -52,11 +64,76 @@ Options:
 """
 
 
+def read_member(path: Path, name: str) -> Optional[bytes]:
+    """Return the contents of `name` from the zip file at `path`.
+
+    Unlike `zipfile.ZipFile`, this only parses the one central directory entry
+    we need instead of all of them (Cosmopolitan Python has thousands).
+    Returns `None` if `zipfile` should be used instead (e.g., ZIP64, encrypted,
+    or not found).
+    """
+    with path.open("rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail_size = min(end, ZIP_END.size + 0xFFFF)  # longest possible comment
+        f.seek(end - tail_size)
+        tail = f.read(tail_size)
+        pos = tail.rfind(b"PK\x05\x06")
+        if pos == -1 or pos + ZIP_END.size > len(tail):
+            return None
+        cd_size, cd_offset = ZIP_END.unpack_from(tail, pos)[5:7]
+        cd_start = end - tail_size + pos - cd_size
+        concat = cd_start - cd_offset  # bytes before the zip (e.g., APE header)
+        if concat < 0 or cd_offset == 0xFFFFFFFF:
+            return None
+        f.seek(cd_start)
+        cd = f.read(cd_size)
+
+        # search backwards: for duplicate names, the last one wins
+        needle = name.encode("utf-8")
+        index = len(cd)
+        while (index := cd.rfind(needle, 0, index)) != -1:
+            header = index - ZIP_CENTRAL.size
+            if header >= 0 and cd.startswith(b"PK\x01\x02", header):
+                entry = ZIP_CENTRAL.unpack_from(cd, header)
+                if entry[10] == len(needle):  # whole name matched
+                    break
+        else:
+            return None
+
+        flags, method = entry[3:5]
+        crc, compressed, size = entry[7:10]
+        offset = entry[16]
+        if flags & 0x1 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return None
+        if 0xFFFFFFFF in (compressed, size, offset):
+            return None
+
+        f.seek(concat + offset)
+        local = f.read(ZIP_LOCAL.size)
+        if len(local) != ZIP_LOCAL.size or not local.startswith(b"PK\x03\x04"):
+            return None
+        name_len, extra_len = ZIP_LOCAL.unpack(local)[9:11]
+        f.seek(name_len + extra_len, os.SEEK_CUR)
+        data = f.read(compressed)
+
+    if method == zipfile.ZIP_DEFLATED:
+        try:
+            data = zlib.decompress(data, -15)
+        except zlib.error:
+            return None
+    if len(data) != size or zlib.crc32(data) != crc:
+        return None
+    return data
+
+
 def self_update(path: Path) -> int:
     """Run the self-updater."""
-    with zipfile.ZipFile(path, "r") as f:
-        local = Receipt.from_dict(json.loads(f.read(PATH_RECEIPT)))
-        log.debug(f"Embedded receipt: {local}")
+    data = read_member(path, PATH_RECEIPT)
+    if data is None:
+        with zipfile.ZipFile(path, "r") as f:
+            data = f.read(PATH_RECEIPT)
+    local = Receipt.from_dict(json.loads(data))
+    log.debug(f"Embedded receipt: {local}")
 
     url = ENV.get("RECEIPT_URL", local.receipt_url)
     log.debug(f"Receipt URL: {url}")
@@ -5,17 +5,45 @@ from __future__ import annotations
 from datetime import datetime
 from fnmatch import fnmatch
 from operator import attrgetter
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
 from typing import Union
 from zipfile import ZIP_DEFLATED
 from zipfile import ZipFile
 from zipfile import ZipInfo
 import logging
+import zlib
 
 
 log = logging.getLogger(__name__)
 now = datetime.now()
 
 
+class Deflated(NamedTuple):
+    """File contents already compressed for a `ZIP_DEFLATED` entry."""
+
+    data: bytes
+    """Raw DEFLATE stream (no zlib header)."""
+
+    crc: int
+    """CRC-32 of the uncompressed contents."""
+
+    size: int
+    """Size of the uncompressed contents."""
+
+    @staticmethod
+    def compress(
+        data: Union[bytearray, bytes], level: Optional[int] = None
+    ) -> Deflated:
+        """Compress `data` the same way `ZipFile` does."""
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        return Deflated(deflated, zlib.crc32(data), len(data))
+
+
 class ZipFile2(ZipFile):
     """Extension of `zipfile.ZipFile` that allows removing members."""
 
@@ -39,23 +67,26 @@ class ZipFile2(ZipFile):
     def add_file(
         self,
         path: str,
-        data: Union[bytearray, bytes, str],
+        data: Union[bytearray, bytes, str, Deflated],
         mode: int = 0o644,
         date: datetime = now,
     ) -> ZipFile2:
-        """Add a file to an archive with appropriate permissions."""
+        """Add a file to an archive with appropriate permissions.
+
+        If `data` is `Deflated`, it is written as-is without compressing again.
+        """
         info = ZipInfo(path, date.timetuple()[:6])
         info.compress_type = ZIP_DEFLATED
         info.external_attr = (0x8000 | (mode & 0xFFFF)) << 16
         info.flag_bits |= 0x800
-        self.writestr(info, data)
+        if isinstance(data, Deflated):
+            return self._add_deflated(info, data)
+        # NOTE: `writestr` ignores the archive's level when given a `ZipInfo`.
+        self.writestr(info, data, compresslevel=self.compresslevel)
         return self
 
-    # https://github.com/python/cpython/commit/659eb048cc9cac73c46349eb29845bc5cd630f09
-    def remove(self, member: Union[str, ZipInfo]) -> ZipFile2:
-        """Remove a file from the archive. The archive must be open with mode 'a'"""
-        if self.mode != "a":
-            raise RuntimeError("remove() requires mode 'a'")
+    def _add_deflated(self, info: ZipInfo, data: Deflated) -> ZipFile2:
+        """Internal method to write a member that is already compressed."""
         if not self.fp:
             raise ValueError("Attempt to write to ZIP archive that was already closed")
         if self._writing:
@@ -63,6 +94,29 @@ class ZipFile2(ZipFile):
                 "Can't write to ZIP archive while an open writing handle exists."
             )
 
+        # sizes and CRC are known, so the header is written once (no descriptor)
+        info.flag_bits = 0x00  # like `ZipFile._open_to_write`
+        info.CRC = data.crc
+        info.file_size = data.size
+        info.compress_size = len(data.data)
+        with self._lock:  # type: ignore
+            if self._seekable:  # type: ignore
+                self.fp.seek(self.start_dir)
+            info.header_offset = self.fp.tell()
+            self._writecheck(info)  # type: ignore
+            self._didModify = True
+            self.fp.write(info.FileHeader())
+            self.fp.write(data.data)
+            self.start_dir = self.fp.tell()
+            self.filelist.append(info)
+            self.NameToInfo[info.filename] = info
+        return self
+
+    # https://github.com/python/cpython/commit/659eb048cc9cac73c46349eb29845bc5cd630f09
+    def remove(self, member: Union[str, ZipInfo]) -> ZipFile2:
+        """Remove a file from the archive. The archive must be open with mode 'a'"""
+        self._check_remove()
+
         # zinfo
         if isinstance(member, ZipInfo):
             return self._remove_member(member)
@@ -72,35 +126,55 @@ class ZipFile2(ZipFile):
             return self._remove_member(self.getinfo(member))
 
         # glob
-        for item in self.filelist:
-            if fnmatch(item.filename, member):
-                self._remove_member(item)
-        return self
+        return self._remove_members(
+            [item for item in self.filelist if fnmatch(item.filename, member)]
+        )
+
+    def remove_members(self, members: Iterable[ZipInfo]) -> ZipFile2:
+        """Remove several members, moving the remaining entries only once."""
+        self._check_remove()
+        return self._remove_members(list(members))
+
+    def _check_remove(self) -> None:
+        """Internal method to raise an error if members cannot be removed."""
+        if self.mode != "a":
+            raise RuntimeError("remove() requires mode 'a'")
+        if not self.fp:
+            raise ValueError("Attempt to write to ZIP archive that was already closed")
+        if self._writing:
+            raise ValueError(
+                "Can't write to ZIP archive while an open writing handle exists."
+            )
 
     def _remove_member(self, member: ZipInfo) -> ZipFile2:
         """Internal method to remove a member."""
+        return self._remove_members([member])
+
+    def _remove_members(self, members: List[ZipInfo]) -> ZipFile2:
+        """Internal method to remove members in a single compaction pass."""
         fp = self.fp
         assert fp
+        if not members:
+            return self
 
         # sort by header_offset in case central dir has different order
-        entry_offset = 0
+        removed = set(map(id, members))
+        entry_offset = 0  # bytes removed so far
         filelist = sorted(self.filelist, key=attrgetter("header_offset"))
         last_index = len(filelist) - 1
         for i, info in enumerate(filelist):
-            if info.header_offset < member.header_offset:  # keep going until target
-                continue
-
             # get the total size of the entry
-            entry_size = None
             if i == last_index:
                 entry_size = self.start_dir - info.header_offset
             else:
                 entry_size = filelist[i + 1].header_offset - info.header_offset
 
-            if member == info:  # set the entry offset
-                entry_offset = entry_size
+            if id(info) in removed:  # grow the gap
+                entry_offset += entry_size
+                continue
+            if not entry_offset:  # before the first removed member
                 continue
-            # move all subsequent entries
+            # move this entry back over the gap
 
             # read the actual entry data
             fp.seek(info.header_offset)
@@ -112,12 +186,14 @@ class ZipFile2(ZipFile):
             # write the entry to the new position
             fp.seek(info.header_offset)
             fp.write(entry_data)
-            fp.flush()
+        fp.flush()
 
         # update state
         self.start_dir -= entry_offset
-        self.filelist.remove(member)
-        del self.NameToInfo[member.filename]
+        self.filelist[:] = [info for info in self.filelist if id(info) not in removed]
+        for member in members:
+            if self.NameToInfo.get(member.filename) is member:
+                del self.NameToInfo[member.filename]
         self._didModify = True
 
         # seek to the start of the central dir
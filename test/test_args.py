@@ -23,6 +23,28 @@ def test_basic() -> None:
     ) == Args(clone=True, args="-m foo", output=Path("bar/baz"), add=["src/repo"])
 
 
+def test_argv_unchanged() -> None:
+    """Parsing does not consume the caller's list."""
+    argv = split("--output out.com src")
+    Args.parse(argv)
+    assert argv == ["--output", "out.com", "src"]
+
+
+def test_positional() -> None:
+    """Positional paths are added."""
+    assert Args.parse(split("a b --add c d -x e f")) == Args(
+        add=["a", "b", "c", "d", "f"], exclude=["e"]
+    )
+
+
+def test_duplicates() -> None:
+    """Duplicate patterns are dropped."""
+    assert Args.parse(split("-x b -x a -x b --rm c --rm c")) == Args(
+        exclude=["b", "a"], remove=["c"]
+    )
+    assert Args.parse(split("src src/cosmofy src")) == Args(add=["src", "src/cosmofy"])
+
+
 def test_dry_run() -> None:
     """dry_run => for_real."""
     args = Args()
@@ -34,6 +56,11 @@ def test_dry_run() -> None:
     assert not args.for_real
 
 
+def test_repeated_path() -> None:
+    """Last path option wins."""
+    assert Args.parse(split("-o a.com -o b.com")) == Args(output=Path("b.com"))
+
+
 def test_disable_cache() -> None:
     """Disable cache."""
     assert Args.parse(split("--cache 0")) == Args(cache=None)
@@ -42,6 +69,25 @@ def test_disable_cache() -> None:
     assert Args.parse(split("--cache FALSE")) == Args(cache=None)
 
 
+def test_cache_pyc() -> None:
+    """Caching bytecode is opt-in."""
+    assert not Args().cache_pyc
+    assert Args.parse(split("--cache-pyc")) == Args(cache_pyc=True)
+
+
+def test_compress_level() -> None:
+    """Compression level must be an integer from 0 to 9."""
+    assert Args.parse(split("--compress-level 9")) == Args(compress_level=9)
+    with pytest.raises(ValueError):
+        Args.parse(split("--compress-level fast"))
+    with pytest.raises(ValueError):
+        Args.parse(split("--compress-level 10"))
+    assert Args.parse(split("--jobs 1")) == Args(jobs=1)
+    for bad in ["²", "٣", "-1", "+1", "62"]:
+        with pytest.raises(ValueError, match="--jobs"):
+            Args.parse(["--jobs", bad])
+
+
 def test_self_updater() -> None:
     """Self updater args."""
     release = "http://example.com/foo"
@@ -70,3 +116,15 @@ def test_bad_arg() -> None:
 
     with pytest.raises(ValueError):
         Args.parse(["--add"])
+
+
+def test_aliases() -> None:
+    """Short option names."""
+    assert Args.parse(split("-h -n -o out.com -x '*.pyc' --rm 'usr/*' src")) == Args(
+        help=True,
+        dry_run=True,
+        output=Path("out.com"),
+        exclude=["*.pyc"],
+        remove=["usr/*"],
+        add=["src"],
+    )
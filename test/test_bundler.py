@@ -3,6 +3,7 @@
 # std
 from pathlib import Path
 from typing import Iterator
+from typing import Optional
 from typing import Set
 from typing import Tuple
 from unittest.mock import patch
@@ -10,6 +11,7 @@ from unittest.mock import MagicMock
 from zipfile import ZipInfo
 import io
 import os
+import shlex
 import tempfile
 
 # lib
@@ -28,10 +30,17 @@ from cosmofy.zipfile2 import ZipFile2
 EXAMPLES = Path(__file__).parent.parent / "examples"
 (EXAMPLES / "empty").mkdir(parents=True, exist_ok=True)  # cannot be committed
 
-Include = Iterator[Tuple[Path, Set[str]]]
+Include = Iterator[Tuple[Path, Optional[Set[str]]]]
 """Type of include."""
 
 
+def test_walk() -> None:
+    """Walk a directory tree."""
+    expected = {d: sorted(f) for d, _, f in os.walk(EXAMPLES)}
+    assert dict(bundler._walk(str(EXAMPLES))) == expected
+    assert list(bundler._walk(str(EXAMPLES / "missing"))) == []
+
+
 def test_globs() -> None:
     """Glob patterns."""
     src = EXAMPLES / "pkg-nested"
@@ -44,18 +53,51 @@ def test_globs() -> None:
     assert next(items_i) == (src.parent, set())  # examples only has sub-folders
 
     items = list(bundler.expand_globs(src, "*"))
-    assert items[0] == (src / "__init__.py", set())
+    assert items[0] == (src / "__init__.py", None)
     assert len(items) > 1
 
+    # plain paths are not globbed
+    items = list(bundler.expand_globs(src, "__init__.py", "missing.py"))
+    assert items == [(src / "__init__.py", None)]
+
     # see same item multiple times
     items = list(bundler.expand_globs(src, "*", "*"))
     assert items
+    assert items == list(bundler.expand_globs(src, "*"))
+    paths = [p for p, _ in bundler.expand_globs(src, "*", ".", "sub-folder")]
+    assert len(paths) == len(set(paths))
+
+    # excluded folders are not searched
+    sub = src / "sub-folder"
+    items = list(bundler.expand_globs(src, ".", exclude={sub}))
+    assert (sub, set()) in items
+    assert not [p for p, _ in items if sub in p.parents]
+    assert list(bundler.expand_globs(src, "sub-folder", exclude={sub})) == [
+        (sub, set())
+    ]
+    # paths inside excluded folders are skipped
+    assert list(bundler.expand_globs(src, "sub-folder/*", exclude={sub})) == []
+
+    # matching does not search folders
+    assert list(bundler.match_globs(src, ".", "sub-folder", "missing")) == [src, sub]
 
     src = EXAMPLES / "empty"
     src.mkdir(parents=True, exist_ok=True)
     assert list(bundler.expand_globs(src, "*")) == []
 
 
+def test_split_args() -> None:
+    """Split args like a shell."""
+    for args in [
+        "",
+        "-m foo.bar",
+        "  -m\tfoo  --extra\n",
+        "-c 'print(1)'",
+        '-c "a b" \\x',
+    ]:
+        assert bundler.split_args(args) == shlex.split(args)
+
+
 def test_copy() -> None:
     """Copy file."""
     content = b"test content"
@@ -68,6 +110,13 @@ def test_copy() -> None:
         Bundler(Args()).fs_copy(src, dest)
         assert dest.read_bytes() == content
 
+        os.chmod(src, 0o755)
+        with patch("fcntl.ioctl", side_effect=OSError):  # cannot clone
+            assert bundler.copy_file(src, dest).read_bytes() == content
+            with patch("os.copy_file_range", side_effect=OSError, create=True):
+                assert bundler.copy_file(src, dest).read_bytes() == content
+        assert os.access(dest, os.X_OK)
+
 
 def test_move() -> None:
     """Move and make executable."""
@@ -115,6 +164,11 @@ def test_setup_temp() -> None:
     assert real[1] is None  # gets built later
     real[0].unlink()  # cleanup
 
+    with tempfile.TemporaryDirectory() as d:
+        output = Path(d) / "sub" / "out.com"
+        real = Bundler(Args(output=output)).setup_temp()
+        assert real[0].parent == output.parent  # move is a rename
+
 
 def test_setup_archive() -> None:
     """Setup archive."""
@@ -127,6 +181,14 @@ def test_setup_archive() -> None:
     # fresh (dry run)
     assert Bundler(Args(dry_run=True, cache=None)).setup_archive()
 
+    # failed download => no temp file left behind
+    with tempfile.TemporaryDirectory() as d:
+        real = Bundler(Args(cache=None, output=Path(d) / "out.com"))
+        with patch("cosmofy.bundler.download", side_effect=OSError):
+            with pytest.raises(OSError):
+                real.setup_archive()
+        assert not list(Path(d).iterdir())
+
 
 def test_process() -> None:
     """Process a file."""
@@ -154,6 +216,49 @@ def test_process() -> None:
     assert out[2] == ("pkg-with-main",)
 
 
+def test_compile_mmap() -> None:
+    """Map large files into memory."""
+    for path in [
+        EXAMPLES / "single-file" / "file-with-main.py",
+        EXAMPLES / "single-file" / "file-no-main.py",
+    ]:
+        expected = bundler._compile(path)
+        with patch("cosmofy.bundler.MMAP_MIN_SIZE", 0):
+            assert bundler._compile(path) == expected
+
+
+def test_compile_cache() -> None:
+    """Reuse compiled files."""
+    path = EXAMPLES / "pkg-with-init" / "__init__.py"
+    with tempfile.TemporaryDirectory() as d:
+        cache = Path(d) / "pyc"
+        expected = bundler._compile(path)
+        assert bundler._compile(path, cache) == expected  # miss
+        assert len(list(cache.iterdir())) == 1
+
+        with patch("cosmofy.bundler.compile_python") as _compile_python:
+            assert bundler._compile(path, cache) == expected  # hit
+            _compile_python.assert_not_called()
+
+        # corrupt entries are recompiled and overwritten
+        entry = next(cache.iterdir())
+        for corrupt in [b"", b"\x01", b"\x02" + entry.read_bytes()[1:], b"\x01junk"]:
+            entry.write_bytes(corrupt)
+            assert bundler._compile(path, cache) == expected
+            assert entry.read_bytes()[1:] == expected[1]
+
+        # failed write => no stray temp files
+        path = EXAMPLES / "single-file" / "file-no-main.py"
+        with patch("cosmofy.bundler.os.replace", side_effect=OSError):
+            assert bundler._compile(path, cache) == bundler._compile(path)
+        assert len(list(cache.iterdir())) == 1
+
+    assert Bundler(Args()).pyc_cache is None  # opt-in
+    assert Bundler(Args(cache_pyc=True, dry_run=True)).pyc_cache is None
+    assert Bundler(Args(cache_pyc=True, cache=None)).pyc_cache is None
+    assert Bundler(Args(cache_pyc=True, cache=Path("c"))).pyc_cache == Path("c/pyc")
+
+
 def test_add() -> None:
     """Add files."""
     test = Bundler(Args(dry_run=True))
@@ -167,15 +272,15 @@ def test_add() -> None:
 
     # __init__.py without its parent
     path = EXAMPLES / "pkg-with-init" / "__init__.py"
-    include = iter([(path, set())])
+    include = iter([(path, None)])
     assert test.zip_add(archive, include, set()) == (path.parent.name, path.stem)
 
-    include = iter([(path, set())])
+    include = iter([(path, None)])
     assert real.zip_add(archive, include, set()) == (path.parent.name, path.stem)
 
     # no main found
     path = EXAMPLES / "single-file" / "file-no-main.py"
-    include = iter([(path, set())])
+    include = iter([(path, None)])
     assert test.zip_add(archive, include, set()) == (path.stem,)
 
     # include + exclude
@@ -185,6 +290,57 @@ def test_add() -> None:
     assert test.zip_add(archive, include, exclude) == ("pkg-nested", "sub-folder")
 
 
+def test_add_pool() -> None:
+    """Compile files in a process pool."""
+    real = Bundler(Args(cache=None))
+    path = EXAMPLES / "pkg-nested"
+    serial = _archive(io.BytesIO())
+    main = real.zip_add(serial, bundler.expand_globs(EXAMPLES, path.name), set())
+
+    pooled = _archive(io.BytesIO())
+    with patch("cosmofy.bundler.POOL_MIN_FILES", 1):
+        assert (
+            real.zip_add(pooled, bundler.expand_globs(EXAMPLES, path.name), set())
+            == main
+        )
+    assert pooled.namelist() == serial.namelist()
+    for name in serial.namelist():
+        assert pooled.read(name) == serial.read(name)
+
+    # --jobs 1 never starts a pool
+    single = Bundler(Args(cache=None, jobs=1))
+    with patch("cosmofy.bundler.POOL_MIN_FILES", 1):
+        with patch("cosmofy.bundler.ProcessPoolExecutor") as executor:
+            include = bundler.expand_globs(EXAMPLES, path.name)
+            assert single.zip_add(_archive(io.BytesIO()), include, set()) == main
+    executor.assert_not_called()
+
+    # errors while walking still stop the pool
+    def broken() -> Include:
+        yield from bundler.expand_globs(EXAMPLES, path.name)
+        raise KeyboardInterrupt
+
+    with patch("cosmofy.bundler.POOL_MIN_FILES", 1):
+        with patch("cosmofy.bundler.ProcessPoolExecutor") as executor:
+            with pytest.raises(KeyboardInterrupt):
+                real.zip_add(_archive(io.BytesIO()), broken(), set())
+    executor.return_value.shutdown.assert_called_once()
+
+
+def test_add_names() -> None:
+    """Archive names follow packages."""
+    real = Bundler(Args(cache=None))
+    archive = _archive(io.BytesIO())
+    include = bundler.expand_globs(EXAMPLES, "pkg-nested", "pkg-with-init/__init__.py")
+    assert real.zip_add(archive, include, set()) == ("pkg-nested", "sub-folder")
+    assert archive.namelist() == [
+        "Lib/site-packages/pkg-nested/__init__.pyc",
+        "Lib/site-packages/pkg-nested/sub-folder/__main__.pyc",
+        "Lib/site-packages/pkg-nested/sub-folder/ignore.pyc",
+        "Lib/site-packages/pkg-with-init/__init__.pyc",
+    ]
+
+
 def test_remove() -> None:
     """Remove files."""
     test = Bundler(Args(dry_run=True))
@@ -192,8 +348,14 @@ def test_remove() -> None:
     with tempfile.NamedTemporaryFile() as f:
         archive = _archive(f.name)
         archive.add_file(".args", "-m FAKE")
+        archive.add_file("usr/share/terminfo", "")
+        archive.add_file("Lib/site-packages/pip/__init__.pyc", "")
+        archive.add_file("Lib/site-packages/keep.pyc", "")
         test.zip_remove(archive, ".args")
-        real.zip_remove(archive, ".args")
+        assert len(archive.filelist) == 4
+
+        real.zip_remove(archive, ".args", "usr/*", "Lib/site-packages/pip/*")
+        assert archive.namelist() == ["Lib/site-packages/keep.pyc"]
 
 
 def test_add_updater() -> None:
@@ -221,6 +383,8 @@ def test_add_updater() -> None:
         _Z.return_value.read.return_value = b"42"
         test.args.cosmo = True
         assert test.add_updater(archive, "", receipt) == expected
+        _Z.assert_called_once()  # opened once for all the files
+        _Z.return_value.close.assert_called_once()
 
     # no args
     assert real.add_updater(archive, "", receipt) == expected
@@ -276,6 +440,19 @@ def test_write_receipt(_from_path: MagicMock) -> None:
         path.unlink()
 
 
+def test_run_cleanup() -> None:
+    """Failed builds remove their temp file."""
+    with tempfile.TemporaryDirectory() as d:
+        temp = Path(d) / ".cosmofy-temp"
+        real = Bundler(Args(output=Path(d) / "out.com"))
+        with patch("cosmofy.bundler.Bundler.setup_archive") as _setup:
+            _setup.return_value = _archive(temp)
+            with patch("cosmofy.bundler.Bundler.zip_add", side_effect=OSError):
+                with pytest.raises(OSError):
+                    real.run()
+        assert not temp.exists()
+
+
 def test_run() -> None:
     """Run bundler."""
     path = Path("out.com")
@@ -5,17 +5,37 @@ from datetime import datetime
 from datetime import timezone
 from http.client import HTTPMessage
 from pathlib import Path
+from typing import Callable
+from typing import List
 from unittest.mock import MagicMock
 from unittest.mock import mock_open
 from unittest.mock import patch
 from urllib.error import HTTPError
+import errno
 import hashlib
+import os
+import tempfile
+
+# lib
+import pytest
 
 # pkg
 from cosmofy import downloader
 from cosmofy.receipt import Receipt
 
 
+def readinto(*chunks: bytes) -> Callable[[memoryview], int]:
+    """Return a fake `readinto` that yields `chunks` and then EOF."""
+    parts = iter(chunks + (b"",))
+
+    def _readinto(buffer: memoryview) -> int:
+        chunk = next(parts)
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    return _readinto
+
+
 @patch("cosmofy.downloader.urlopen")
 @patch("cosmofy.downloader.Path.open")
 @patch("cosmofy.downloader.Path.mkdir")
@@ -23,11 +43,13 @@ def test_download(_mkdir: MagicMock, _open: MagicMock, _urlopen: MagicMock) -> N
     """Download url."""
     # read url
     _response = MagicMock()
-    _response.read.side_effect = [b"chunk1", b"chunk2", b""]
+    _response.readinto.side_effect = readinto(b"chunk1", b"chunk2")
     _urlopen.return_value.__enter__.return_value = _response
 
-    # open file
+    # open file (chunks share a buffer, so copy them)
+    written: List[bytes] = []
     _output = MagicMock()
+    _output.write.side_effect = lambda chunk: written.append(bytes(chunk))
     _open.return_value.__enter__.return_value = _output
 
     # test
@@ -37,8 +59,7 @@ def test_download(_mkdir: MagicMock, _open: MagicMock, _urlopen: MagicMock) -> N
 
     _urlopen.assert_called_once_with(url)
     _mkdir.assert_called_once_with(parents=True, exist_ok=True)
-    _output.write.assert_any_call(b"chunk1")
-    _output.write.assert_any_call(b"chunk2")
+    assert written == [b"chunk1", b"chunk2"]
     assert result == path
 
 
@@ -60,11 +81,9 @@ def test_download_if_not_exists(_download: MagicMock, _exists: MagicMock) -> Non
 @patch("cosmofy.downloader.Path.exists")
 @patch("cosmofy.downloader.Path.stat")
 @patch("cosmofy.downloader.urlopen")
-@patch("cosmofy.downloader.parsedate_to_datetime")
-@patch("cosmofy.downloader.download")
+@patch("cosmofy.downloader.save")
 def test_download_if_newer(
-    _download: MagicMock,
-    _parsedate: MagicMock,
+    _save: MagicMock,
     _urlopen: MagicMock,
     _stat: MagicMock,
     _exists: MagicMock,
@@ -73,32 +92,29 @@ def test_download_if_newer(
     # local
     _exists.return_value = True  # File exists
     _stat.return_value.st_mtime = datetime(2023, 9, 1, tzinfo=timezone.utc).timestamp()
-    _stat.return_value.st_mode = 33204  # for Path.open
 
     # remote
     _response = MagicMock()
-    _response.headers.get.return_value = "Wed, 02 Sep 2023 00:00:00 GMT"
-    _response.read.side_effect = [b"chunk1", b"chunk2", b""]
+    _response.headers.get.return_value = "Sat, 02 Sep 2023 00:00:00 GMT"
     _urlopen.return_value.__enter__.return_value = _response
-    _parsedate.return_value = datetime(2023, 9, 2, tzinfo=timezone.utc)
 
     # test
     url = "http://example.com"
     path = Path("fake")
-    downloader.download_if_newer(url, path)
+    _save.return_value = path
+    assert downloader.download_if_newer(url, path) == path
 
-    assert _urlopen.called
-    assert _download.called
+    request = _urlopen.call_args[0][0]
+    assert request.get_header("If-modified-since") == "Fri, 01 Sep 2023 00:00:00 GMT"
+    _save.assert_called_once_with(_response, path)
 
 
 @patch("cosmofy.downloader.Path.exists")
 @patch("cosmofy.downloader.Path.stat")
 @patch("cosmofy.downloader.urlopen")
-@patch("cosmofy.downloader.parsedate_to_datetime")
-@patch("cosmofy.downloader.download")
+@patch("cosmofy.downloader.save")
 def test_download_if_not_newer(
-    _download: MagicMock,
-    _parsedate: MagicMock,
+    _save: MagicMock,
     _urlopen: MagicMock,
     _stat: MagicMock,
     _exists: MagicMock,
@@ -107,20 +123,25 @@ def test_download_if_not_newer(
     _exists.return_value = True  # File exists
     _stat.return_value.st_mtime = datetime(2023, 9, 2, tzinfo=timezone.utc).timestamp()
 
-    # remote
-    _response = MagicMock()
-    _response.headers.get.return_value = "Wed, 01 Sep 2023 00:00:00 GMT"
-    _urlopen.return_value.__enter__.return_value = _response
-    _parsedate.return_value = datetime(2023, 9, 1, tzinfo=timezone.utc)
-
-    # test
     url = "http://example.com"
     path = Path("path")
-    result = downloader.download_if_newer(url, path)
 
-    _urlopen.assert_called_once()
-    _download.assert_not_called()
-    assert result == path
+    # server honors If-Modified-Since
+    _urlopen.side_effect = HTTPError(url, 304, "Not Modified", HTTPMessage(), None)
+    assert downloader.download_if_newer(url, path) == path
+
+    # server ignores it, but Last-Modified is older
+    _response = MagicMock()
+    _response.headers.get.return_value = "Fri, 01 Sep 2023 00:00:00 GMT"
+    _urlopen.side_effect = None
+    _urlopen.return_value.__enter__.return_value = _response
+    assert downloader.download_if_newer(url, path) == path
+    _save.assert_not_called()
+
+    # other errors propagate
+    _urlopen.side_effect = HTTPError(url, 500, "Server Error", HTTPMessage(), None)
+    with pytest.raises(HTTPError):
+        downloader.download_if_newer(url, path)
 
 
 @patch("cosmofy.downloader.urlopen")
@@ -131,7 +152,7 @@ def test_download_and_hash(
 ) -> None:
     """Download and hash content."""
     _response = MagicMock()
-    _response.read.side_effect = [b"chunk1", b""]
+    _response.readinto.side_effect = readinto(b"chunk1")
     _urlopen.return_value.__enter__.return_value = _response
 
     url = "https://example.com"
@@ -143,6 +164,25 @@ def test_download_and_hash(
     assert result == hashlib.sha256(b"chunk1").hexdigest()
 
 
+def test_move_executable() -> None:
+    """Rename when possible; copy across filesystems."""
+    with tempfile.TemporaryDirectory() as folder:
+        src, dest = Path(folder) / "src", Path(folder) / "sub" / "dest"
+        src.write_bytes(b"content")
+        assert downloader.move_executable(src, dest) == dest
+        assert dest.read_bytes() == b"content"
+        assert os.access(dest, os.X_OK)
+
+        cross_device = OSError(errno.EXDEV, "Invalid cross-device link")
+        with patch("cosmofy.downloader.os.replace", side_effect=cross_device):
+            assert downloader.move_executable(dest, src) == src
+        assert src.read_bytes() == b"content"
+
+        with patch("cosmofy.downloader.os.replace", side_effect=PermissionError):
+            with pytest.raises(PermissionError):
+                downloader.move_executable(src, dest)
+
+
 @patch("cosmofy.downloader.download_and_hash")
 @patch("cosmofy.downloader.move_executable")
 @patch("cosmofy.downloader.tempfile.NamedTemporaryFile", new_callable=mock_open)
@@ -161,6 +201,9 @@ def test_download_release(
     _move.return_value = path
     result = downloader.download_release(url, path, expected)
     assert result == path
+    _temp.assert_called_with(
+        dir=path.parent, prefix=".fake.", suffix=".part", delete=False
+    )
 
     # bad hash
     _download.return_value = "unexpected"
@@ -182,6 +225,16 @@ def test_download_release(
     assert result is None
 
 
+@patch("cosmofy.downloader.download_and_hash", side_effect=KeyboardInterrupt)
+def test_download_release_cleanup(_download: MagicMock) -> None:
+    """Partial downloads are removed on unexpected errors."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "fake"
+        with pytest.raises(KeyboardInterrupt):
+            downloader.download_release("https://example.com/fake", path, "abc")
+        assert not list(Path(tmp).iterdir())
+
+
 @patch("cosmofy.downloader.Receipt.from_url")
 def test_download_receipt(_from_url: MagicMock) -> None:
     """Download a receipt."""
@@ -2,6 +2,7 @@
 
 # std
 from shlex import split
+import logging
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
@@ -22,7 +23,27 @@ def test_arg_general() -> None:
     assert main(split("cosmofy --debug --help")) == 0, "--help"
 
 
-@patch("cosmofy.__main__.Bundler.run")
+def test_debug_configured() -> None:
+    """--debug works even if the root logger already has handlers."""
+    root = logging.getLogger()
+    level = root.level
+    handler = logging.NullHandler()
+    root.addHandler(handler)
+    try:
+        root.setLevel(logging.WARNING)
+        assert main(split("cosmofy --version")) == 0
+        assert root.level == logging.WARNING, "caller's config kept"
+        assert handler.formatter is None
+
+        assert main(split("cosmofy --debug --version")) == 0
+        assert root.level == logging.DEBUG
+        assert handler.formatter is not None
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+
+
+@patch("cosmofy.bundler.Bundler.run")
 def test_run(_run: MagicMock) -> None:
     """Run the bundler."""
     assert main(split("cosmofy src/cosmofy --dry-run")) == 0
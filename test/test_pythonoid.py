@@ -4,6 +4,7 @@
 from pathlib import Path
 from shlex import split
 from unittest.mock import patch
+import os
 
 # lib
 import pytest
@@ -29,11 +30,40 @@ def test_main_detector() -> None:
     assert not pythonoid.RE_MAIN.search(code)
 
 
+def test_read() -> None:
+    """Read files without buffering."""
+    src = Path(__file__)
+    data, stats = pythonoid.read_file(src)
+    assert data == src.read_bytes()
+    assert stats.st_size == len(data)
+
+    for size in [0, 10, len(data) + 10]:  # wrong size => drain
+        fd = os.open(src, pythonoid.O_READ)
+        try:
+            assert pythonoid.read_fd(fd, size) == data
+        finally:
+            os.close(fd)
+
+
 def test_compile() -> None:
     """Compile python."""
     src = Path(__file__).parent.parent / "src" / "cosmofy" / "__init__.py"
     assert isinstance(pythonoid.compile_python(src), bytearray)
     assert isinstance(pythonoid.compile_python(src, src.read_bytes()), bytearray)
+    assert pythonoid.compile_python(
+        src, src.read_bytes(), src.stat()
+    ) == pythonoid.compile_python(src)
+
+
+def test_compile_matches_importlib() -> None:
+    """Bytecode matches what importlib writes to `__pycache__`."""
+    from importlib._bootstrap_external import _code_to_timestamp_pyc  # type: ignore
+
+    src = Path(__file__).parent.parent / "src" / "cosmofy" / "__init__.py"
+    stats = src.stat()
+    code = compile(src.read_bytes(), src, "exec", dont_inherit=True, optimize=-1)
+    expected = _code_to_timestamp_pyc(code, stats.st_mtime, stats.st_size)
+    assert pythonoid.compile_python(src) == expected
 
 
 def test_parse() -> None:
@@ -58,6 +88,13 @@ def test_parse() -> None:
         script="foo.py", argv=["foo.py", "--extra"]
     )
 
+    # clusters expand in order; caller's list is not consumed
+    argv = split("-qic 'f = 42' --extra")
+    assert PythonArgs.parse(argv) == PythonArgs(
+        q=True, i=True, c="f = 42", argv=["-c", "--extra"]
+    )
+    assert argv == ["-qic", "f = 42", "--extra"]
+
     with patch("cosmofy.updater.sys.stdin") as _stdin:
         _stdin.read.return_value = "f = 42"
         _stdin.isatty.side_effect = [False, True]  # once as non-TTY, once as TTY
@@ -1,16 +1,25 @@
 """Test Receipt."""
 
 # std
+from datetime import datetime
+from datetime import timezone
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import MagicMock
 from unittest.mock import patch
+import hashlib
 import json
+import subprocess
+import tempfile
 
 # lib
 import pytest
 
 # pkg
+from cosmofy.receipt import file_hash
+from cosmofy.receipt import probe_version
 from cosmofy.receipt import Receipt
+from cosmofy.receipt import RECEIPT_MAX_SIZE
 from cosmofy.receipt import RECEIPT_SCHEMA
 
 
@@ -23,6 +32,15 @@ def test_is_newer() -> None:
     assert not r1.is_newer(r1)
 
 
+def test_default_date() -> None:
+    """Default date is when the receipt is created, not imported."""
+    now = datetime(2001, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+    with patch("cosmofy.receipt.datetime") as _datetime:
+        _datetime.now.return_value = now
+        assert Receipt().date == "2001-02-03T04:05:06Z"
+    _datetime.now.assert_called_once_with(timezone.utc)
+
+
 def test_serialization() -> None:
     """Receipt serialization."""
     r1 = Receipt(date="2000-01-01T00:00:00Z")
@@ -37,7 +55,7 @@ def test_serialization() -> None:
         "version": "",
     }
     assert r1.asdict() == expected
-    assert str(r1) == json.dumps(expected)
+    assert str(r1) == json.dumps(expected, separators=(",", ":"))
 
 
 def test_validation() -> None:
@@ -69,6 +87,20 @@ def test_validation() -> None:
     r1.release_url = "https://example.com/foo"
     assert r1.is_valid()
 
+    # no trailing newlines
+    r1.date += "\n"
+    assert not r1.is_valid()
+    r1.date = "2000-01-01T00:00:00Z"
+
+    # published receipts need a hash and version
+    r1.kind = "published"
+    assert not r1.is_valid()
+    r1.update(hash="abcdef", version="1.2.3")
+    assert r1.is_valid()
+    r1.kind = "unknown"
+    assert not r1.is_valid()
+    r1.kind = "embedded"
+
     data = r1.asdict()
     data["foo"] = "bar"
     assert Receipt.find_issues(data) == {
@@ -109,30 +141,79 @@ def test_from_dict() -> None:
         Receipt.from_dict(data)
 
 
-@patch("cosmofy.receipt.json.load")
 @patch("cosmofy.receipt.urlopen")
-def test_from_url(_urlopen: MagicMock, _load: MagicMock) -> None:
+def test_from_url(_urlopen: MagicMock) -> None:
     """Receipt from url."""
-    _urlopen.return_value.read.return_value = b"{}"
-    _load.return_value = {}
-    with pytest.raises(ValueError):
-        Receipt.from_url("https://example.com/foo.json")
-
-
-@patch("cosmofy.receipt.hashlib.new")
-@patch("cosmofy.receipt.Path.read_bytes")
-@patch("cosmofy.receipt.subprocess.run")
-def test_from_path(_run: MagicMock, _read_bytes: MagicMock, _new: MagicMock) -> None:
+    url = "https://example.com/foo.json"
+    _response = _urlopen.return_value.__enter__.return_value
+    _response.read.return_value = b"{}"
+    with pytest.raises(ValueError):  # invalid
+        Receipt.from_url(url)
+
+    expected = Receipt(
+        receipt_url=url, release_url="https://example.com/foo", version="1.0.0"
+    )
+    _response.read.return_value = str(expected).encode()
+    assert Receipt.from_url(url) == expected
+    _response.read.assert_called_with(RECEIPT_MAX_SIZE + 1)
+
+    _response.read.return_value = b" " * (RECEIPT_MAX_SIZE + 1)
+    with pytest.raises(ValueError):  # too big
+        Receipt.from_url(url)
+
+
+def test_file_hash() -> None:
+    """Hash a file in chunks."""
+    content = b"fake content" * 1000
+    expected = hashlib.sha256(content).hexdigest()
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(content)
+        f.flush()
+        path = Path(f.name)
+        assert file_hash(path) == expected
+
+        # python < 3.11
+        with patch("cosmofy.receipt.CHUNK_SIZE", 7):
+            with patch("cosmofy.receipt.hashlib", SimpleNamespace(new=hashlib.new)):
+                assert file_hash(path) == expected
+
+
+@patch("cosmofy.receipt.datestr", MagicMock(return_value="2000-01-01T00:00:00Z"))
+@patch("cosmofy.receipt.file_hash")
+@patch("cosmofy.receipt.probe_version")
+def test_from_path(_probe: MagicMock, _file_hash: MagicMock) -> None:
     """Receipt with hash and version."""
     fake_hash = "0123456789abcdef"
     fake_ver = b"0.1.2"
-    _new.return_value.hexdigest.return_value = fake_hash
-    _read_bytes.return_value = b"fake content"
-    _run.return_value.stdout = fake_ver
+    _file_hash.return_value = fake_hash
+    _proc = _probe.return_value.__enter__.return_value
+    _proc.returncode = 0
+    _proc.communicate.return_value = (fake_ver, b"")
     assert Receipt.from_path(Path("fake")) == Receipt(hash=fake_hash, version="0.1.2")
     assert Receipt.from_path(Path("fake"), version="1.2.3") == Receipt(
         hash=fake_hash, version="1.2.3"
     )
 
-    _run.return_value.stdout = b"no version information"
+    _proc.communicate.return_value = (b"no version information", b"")
     assert Receipt.from_path(Path("fake")) == Receipt(hash=fake_hash, version="")
+
+    _proc.returncode = 1
+    with pytest.raises(subprocess.CalledProcessError):
+        Receipt.from_path(Path("fake"))
+
+
+def test_probe_version() -> None:
+    """Run a binary (or shell script) with `--version`."""
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "fake"
+        path.write_text("echo fake 1.2.3\n")  # not a binary; no shebang
+        path.chmod(0o755)
+        with probe_version(path) as proc:
+            assert proc.communicate()[0] == b"fake 1.2.3\n"
+        assert proc.args == ["sh", str(path.resolve()), "--version"]
+
+        path.write_text("#!/bin/sh\necho fake 1.2.4\n")
+        assert Receipt.from_path(path).version == "1.2.4"
+
+        with pytest.raises(OSError):
+            probe_version(path / "missing")
@@ -5,12 +5,50 @@ from pathlib import Path
 from shlex import split
 from unittest.mock import MagicMock
 from unittest.mock import patch
+import io
+import tempfile
+import zipfile
 
 # pkg
 from cosmofy import updater
 from cosmofy.receipt import Receipt
 
 
+def test_read_member() -> None:
+    """Read one member without parsing the whole central directory."""
+    name = updater.PATH_RECEIPT
+    content = b'{"kind": "embedded"}' * 10
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "fake.com"
+        for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", compression) as archive:
+                archive.writestr(f"{name}.bak", b"not this one")
+                archive.writestr(name, content)
+                archive.writestr("other", b"other", compress_type=zipfile.ZIP_LZMA)
+                archive.comment = b"comment"
+
+            # offsets are relative to the zip, not the file
+            path.write_bytes(b"MZ prefix" + buffer.getvalue())
+            assert updater.read_member(path, name) == content
+            assert updater.read_member(path, "missing") is None
+            assert updater.read_member(path, "other") is None  # let zipfile do it
+            with zipfile.ZipFile(path) as archive:
+                assert archive.read(name) == content
+
+        # corrupted contents
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            archive.writestr(name, content)
+        path.write_bytes(buffer.getvalue().replace(content, content.upper()))
+        assert updater.read_member(path, name) is None
+
+        # not a zip
+        path.write_bytes(b"not a zip file")
+        assert updater.read_member(path, name) is None
+
+
+@patch("cosmofy.updater.read_member", MagicMock(return_value=None))
 @patch("cosmofy.updater.zipfile.ZipFile")
 @patch("cosmofy.updater.Receipt.from_dict")
 @patch("cosmofy.updater.download_receipt")
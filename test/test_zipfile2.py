@@ -3,6 +3,7 @@
 # std
 from unittest.mock import MagicMock
 from unittest.mock import patch
+from zipfile import ZIP_DEFLATED
 from zipfile import ZipInfo
 import io
 
@@ -10,6 +11,7 @@ import io
 import pytest
 
 # pkg
+from cosmofy.zipfile2 import Deflated
 from cosmofy.zipfile2 import ZipFile2
 
 
@@ -64,3 +66,63 @@ def test_remove_real() -> None:
     file.remove("real/remove2")
     file.remove("real/r*")
     assert len(file.filelist) == 2
+
+
+def test_remove_members() -> None:
+    """Remove several members at once."""
+    buffer = io.BytesIO()
+    with ZipFile2(buffer, "a", ZIP_DEFLATED) as file:
+        for i in range(6):
+            file.writestr(f"file{i}", f"contents of {i}" * (i + 1))
+        file.remove_members(file.getinfo(f"file{i}") for i in (1, 2, 4))
+        file.remove_members([])
+        assert file.namelist() == ["file0", "file3", "file5"]
+
+    with ZipFile2(buffer, "r") as file:  # reopen to check offsets
+        assert file.testzip() is None
+        assert file.read("file3") == b"contents of 3" * 4
+        assert file.read("file5") == b"contents of 5" * 6
+
+
+def test_add_file_level() -> None:
+    """Added files use the archive's compression level."""
+    data = bytes(range(256)) * 64 + b"cosmofy" * 1000
+    fast = ZipFile2(io.BytesIO(), "a", ZIP_DEFLATED, compresslevel=1)
+    best = ZipFile2(io.BytesIO(), "a", ZIP_DEFLATED, compresslevel=9)
+    fast.add_file("data", data)
+    best.add_file("data", data)
+    assert fast.read("data") == best.read("data") == data
+    assert fast.getinfo("data")._compresslevel == 1  # type: ignore
+    assert best.getinfo("data")._compresslevel == 9  # type: ignore
+
+
+def test_add_deflated() -> None:
+    """Add members that are already compressed."""
+    data = b"cosmofy" * 1000
+    buffer = io.BytesIO()
+    with ZipFile2(buffer, "a", ZIP_DEFLATED, compresslevel=6) as file:
+        file.add_file("plain", data)
+        file.add_file("deflated", Deflated.compress(data, 6))
+        assert file.getinfo("deflated").compress_size == len(
+            Deflated.compress(data, 6).data
+        )
+        assert (
+            file.getinfo("plain").compress_size
+            == file.getinfo("deflated").compress_size
+        )
+
+    with ZipFile2(buffer, "r") as file:
+        assert file.testzip() is None
+        assert file.read("plain") == file.read("deflated") == data
+
+    file = ZipFile2(io.BytesIO(), "a")
+    file.close()
+    with pytest.raises(ValueError):
+        file.add_file("closed", Deflated.compress(data))
+
+    file = ZipFile2(io.BytesIO(), "a")
+    file._writing = True
+    with pytest.raises(ValueError):
+        file.add_file("writing", Deflated.compress(data))
+    file._writing = False
+    file.close()